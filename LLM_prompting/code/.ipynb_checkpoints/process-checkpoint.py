@@ -1,10 +1,12 @@
 from prompt_generator import prompt_generator
-from auto_LLMs import auto_LLMs
+from llm_scheduler import schedule_LLMs
+from build_manifest import MANIFEST_NAME, BuildManifest
 from pathlib import Path
 import os
 import pandas as pd
 
-def process(prompt_path: str, data_path: str, models: list, hf_token: str, output_path: str, chosen_rules="all", verbose=False):
+def process(prompt_path: str, data_path: str, models: list, hf_token: str, output_path: str, chosen_rules="all", verbose=False,
+            concurrency=1, cache=None, resume=False, backend="ollama", endpoints=None, incremental=True):
     """
     Generates prompts for all rules, gets results from a series of LLMs per chosen rules.
 
@@ -15,7 +17,14 @@ def process(prompt_path: str, data_path: str, models: list, hf_token: str, outpu
         User's HuggingFace Token for authentication (hf_token: str) ,
         Path to the folder where resulting components will be outputted (output_path: str) ,
         A list of rules whose prompts will be processed by the LLMs, considers all rules by default (chosen_rules: "all" or list) ,
-        Indicator for if the progress should be printed, False by default (verbose: bool) .
+        Indicator for if the progress should be printed, False by default (verbose: bool) ,
+        Number of parallel requests per model, as an int or a {model: int} mapping, 1 by default (concurrency: int or dict) ,
+        Response cache, True for "llm_cache.sqlite" in the answers folder or a path to a cache file, disabled by default (cache: bool, str or ResponseCache) ,
+        Indicator for if answers journaled by an interrupted run should be kept, False by default (resume: bool) ,
+        Where models run, "ollama" for the HTTP endpoint or "local" to score Yes/No logits in-process with transformers (backend: str) ,
+        Base URLs of several Ollama hosts to route requests across with model affinity, the single default host if None (endpoints: list) ,
+        Indicator for if only the prompts and (prompt, model) answers whose inputs changed since the last run should be rebuilt,
+        as recorded with what was rebuilt and reused in "manifest.json" in the output folder, True by default (incremental: bool) .
 
     Returns:
         None .
@@ -31,8 +40,11 @@ def process(prompt_path: str, data_path: str, models: list, hf_token: str, outpu
     prompts_path = output_path / "prompts"
     os.makedirs(prompts_path, exist_ok=True)
 
-    # Generate prompts for all rules
-    prompt_generator(prompt_path=prompt_path, data_path=data_path, output_path=prompts_path)
+    # Hashes of each stage's inputs, to rebuild only what changed since the last run
+    manifest = BuildManifest(output_path / MANIFEST_NAME) if incremental else None
+
+    # Generate prompts for all rules, written to the prompts folder
+    prompt_generator(prompt_path=prompt_path, data_path=data_path, output_path=output_path, manifest=manifest)
     print("Generated prompts.\n -----") if verbose else None
 
     # Create an answers folder where LLM answers per rule will be written
@@ -43,11 +55,12 @@ def process(prompt_path: str, data_path: str, models: list, hf_token: str, outpu
     if chosen_rules == "all":
         chosen_rules = [ x.stem for x in prompts_path.glob("**/*") if x.is_file() ]
         
-    # Get LLMs' results per rule
-    for rule in chosen_rules:
-        rule_path = prompts_path / f"{rule}.csv"
-        auto_LLMs(rule_path=rule_path, models=models, hf_token=hf_token, output_path=answers_path)
-        print(f"Generated LLM answers for rule {rule}.\n -----") if verbose else None
+    # Get LLMs' results for all chosen rules at once, model by model, so each model is loaded only once
+    rule_paths = [prompts_path / f"{rule}.csv" for rule in chosen_rules]
+    schedule_LLMs(rule_paths=rule_paths, models=models, hf_token=hf_token, output_path=answers_path,
+                  concurrency=concurrency, cache=cache, resume=resume, backend=backend, endpoints=endpoints,
+                  manifest=manifest)
+    print(f"Generated LLM answers for rules {', '.join(chosen_rules)}.\n -----") if verbose else None
 
     print("Done.") if verbose else None
 
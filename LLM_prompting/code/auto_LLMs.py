@@ -1,12 +1,140 @@
 from pathlib import Path
 import pandas as pd
-from tqdm import tqdm
-from openai import OpenAI
+from llm_router import make_client
 from huggingface_hub import login
 from transformers import pipeline, AutoTokenizer
 import torch
+from llm_engine import run_prompts
+from llm_cache import open_cache
+from llm_journal import ResultJournal
+from llm_metrics import METRICS_NAME, open_metrics
+from local_backend import LocalYesNoScorer
+from batch_prompts import single_messages, run_candidate_batches
 
-def auto_LLMs(rule_path: str, models: list, output_path: str):
+def format_messages(rule: pd.DataFrame):
+    """
+    Splits each rule prompt into its context and question and formats them as chat messages.
+    
+    Args:
+        Rule prompts table with a "Prompt" column (rule: pd.DataFrame) .
+    
+    Returns:
+        The contexts, questions and message lists, None for prompts that could not be split (tuple of lists) .
+    """
+    contexts, questions, message_lists = [], [], []
+    for ix in range(rule.shape[0]):
+        try:
+            # Get the prompt and clean unnecessary spaces
+            prompt = rule["Prompt"].iloc[ix].strip()
+            context, question = prompt.split("\n\n", 1)  # Split prompt into context and question
+            messages = single_messages(context, question)
+        except Exception as e:
+            print(f"Error formatting prompt {ix}: {e}")
+            context, question, messages = None, None, None
+        contexts.append(context)
+        questions.append(question)
+        message_lists.append(messages)
+    return contexts, questions, message_lists
+
+def get_model_answers(client, model: str, contexts: list, questions: list, message_lists: list, backend="ollama",
+                      hf_token=None, batch_size=8, candidate_batch_size=1, concurrency=1, cache=None, journal=None,
+                      row_ids=None, scorer=None, retries=2, metrics=None, **decoding):
+    """
+    Answers formatted prompts with one model, through the backend and batching mode chosen for auto_LLMs.
+    
+    Args:
+        The LLM client (client: OpenAI or EndpointRouter) ,
+        The model (model: str) ,
+        The prompts as returned by format_messages (contexts, questions, message_lists: list) ,
+        The remaining options as in auto_LLMs, and row ids for the journal (row_ids: list) ,
+        An already loaded local model, loaded and released here if None (scorer: LocalYesNoScorer) ,
+        Number of retries of failed requests and the request metrics, as in run_prompts (retries: int, metrics: RequestMetrics) .
+    
+    Returns:
+        The answers, and their probabilities for the local backend or None (tuple) .
+    """
+    if backend == "local":
+        # One forward pass per batch, comparing the "Yes" and "No" next-token logits
+        if scorer is None:
+            scorer = LocalYesNoScorer(model, batch_size=batch_size, hf_token=hf_token)
+        valid = [ix for ix, messages in enumerate(message_lists) if messages is not None]
+        answers = ["Error"] * len(message_lists)
+        confidences = [None] * len(message_lists)
+        for ix, (label, probability) in zip(valid, scorer.score([message_lists[ix] for ix in valid])):
+            answers[ix] = label
+            confidences[ix] = probability
+        del scorer
+        return answers, confidences
+
+    if candidate_batch_size > 1:
+        # Streamed answers are cut down to a single verdict, so they cannot carry one numbered answer per candidate;
+        # the output token limit is set per batch
+        if decoding.get("stream"):
+            raise ValueError("Streaming (stream=True) cannot be combined with candidate_batch_size > 1.")
+        # One request per batch of candidates sharing the rule constant's context
+        answers = run_candidate_batches(client, model, contexts, questions, candidate_batch_size, row_ids=row_ids,
+                                        concurrency=concurrency, cache=cache, journal=journal, retries=retries,
+                                        metrics=metrics)
+    else:
+        # Get responses from the model
+        answers = run_prompts(client, model, message_lists, concurrency=concurrency, cache=cache, journal=journal,
+                              row_ids=row_ids, retries=retries, metrics=metrics, **decoding)
+    return answers, None
+
+def answer_in_chunks(client, rule_path: Path, models: list, output_path: Path, chunksize: int, backend="ollama",
+                     hf_token=None, batch_size=8, **options):
+    """
+    Answers the prompts of a rule file with bounded memory: each model reads the prompts chunk by chunk and appends
+    its answers to "{stem}_{model}.csv" as each chunk completes, then the models' files are joined chunk by chunk
+    into "{stem}_final.csv". Only one chunk per file is held in memory at a time.
+    
+    Args:
+        The LLM client (client: OpenAI or EndpointRouter) ,
+        Path to the file containing rule prompts (rule_path: Path) ,
+        A list of LLM models (models: list) ,
+        Path to the folder where the results will be outputted (output_path: Path) ,
+        Number of prompts read at a time (chunksize: int) ,
+        The remaining options as in get_model_answers .
+    
+    Returns:
+        None .
+    """
+    for model in models:
+        print(f"Processing model: {model}")
+        # Load a local model once, not once per chunk
+        scorer = LocalYesNoScorer(model, batch_size=batch_size, hf_token=hf_token) if backend == "local" else None
+        model_path = output_path / f"{rule_path.stem}_{model}.csv"
+        start = 0
+        for ix, chunk in enumerate(pd.read_csv(rule_path, chunksize=chunksize)):
+            contexts, questions, message_lists = format_messages(chunk)
+            # Rows keep their position in the whole file, so journals are shared with unchunked runs
+            answers, confidences = get_model_answers(client, model, contexts, questions, message_lists,
+                                                     backend=backend, hf_token=hf_token, batch_size=batch_size,
+                                                     row_ids=list(range(start, start + len(chunk))), scorer=scorer,
+                                                     **options)
+            start += len(chunk)
+            if confidences is not None:
+                chunk[f"{model}_confidence"] = confidences
+            chunk[model] = answers
+            chunk.drop(columns=["Prompt"]).to_csv(model_path, mode="w" if ix == 0 else "a", header=ix == 0, index=False)
+        del scorer
+        print(f"Results saved for model {model} to {model_path}")
+
+    # Join the models' answers, reading their files in lockstep
+    final_path = output_path / f"{rule_path.stem}_final.csv"
+    readers = [pd.read_csv(output_path / f"{rule_path.stem}_{model}.csv", chunksize=chunksize) for model in models]
+    for ix, chunks in enumerate(zip(*readers)):
+        final = chunks[0]
+        for model, chunk in zip(models[1:], chunks[1:]):
+            for column in [f"{model}_confidence", model]:
+                if column in chunk.columns:
+                    final[column] = chunk[column].to_numpy()
+        final.to_csv(final_path, mode="w" if ix == 0 else "a", header=ix == 0, index=False)
+    print(f"Final results saved to {final_path}")
+
+def auto_LLMs(rule_path: str, models: list, output_path: str, concurrency=1, cache=None, resume=False,
+              stream=False, token_budget=None, time_budget=None, backend="ollama", hf_token=None, batch_size=8,
+              candidate_batch_size=1, endpoints=None, chunksize=None, retries=2, metrics=None):
     """
     For a given list of LLMs and a list of prompts, answers are generated, recorded, and written to a CSV file.
     
@@ -14,71 +142,88 @@ def auto_LLMs(rule_path: str, models: list, output_path: str):
         Path to the file containing rule prompts (rule_path: str) ,
         A list of LLM models (models: list) ,
         User's HuggingFace Token for authentication (hf_token: str) ,
-        Path to the folder where the result will be outputted (output_path: str) .
+        Path to the folder where the result will be outputted (output_path: str) ,
+        Number of parallel requests per model, as an int or a {model: int} mapping, 1 by default (concurrency: int or dict) ,
+        Response cache, True for "llm_cache.sqlite" in the output folder or a path to a cache file, disabled by default (cache: bool, str or ResponseCache) ,
+        Indicator for if answers journaled by an interrupted run should be kept, False by default (resume: bool) ,
+        Indicator for if answers should be streamed, normalized to Yes/No/NA and cut off once a verdict is parsed, False by default (stream: bool) ,
+        Maximum number of streamed tokens per prompt, for reasoning models, no limit by default (token_budget: int) ,
+        Maximum number of seconds per prompt when streaming, no limit by default (time_budget: float) ,
+        Where models run, "ollama" for the HTTP endpoint or "local" to score Yes/No logits in-process with transformers (backend: str) ,
+        Number of prompts per forward pass for the local backend, 8 by default (batch_size: int) ,
+        Number of candidate classes of the same rule constant asked about in one request, 1 (one request per candidate) by default, not combined with stream (candidate_batch_size: int) ,
+        Base URLs of several Ollama hosts to route requests across with model affinity, the single default host if None (endpoints: list) ,
+        Number of prompts read at a time for bounded memory on very large files, the whole file at once if None (chunksize: int) ,
+        Number of times a failed request is retried, with exponential backoff, before it is recorded as "Error", 2 by default; the OpenAI client itself no longer retries, so every retry is counted in the metrics (retries: int) ,
+        Per-request metrics (timing, tokens, retries, cache hits, error classes), True for "{stem}_llm_metrics.csv/.json" in the output folder or a path, disabled by default (metrics: bool, str or RequestMetrics) .
     
     Returns:
         None .
     """
-  # Load the rules
     rule_path = Path(rule_path)
-    rule = pd.read_csv(rule_path)
 
     # Ensure output path exists
     output_path = Path(output_path)
     output_path.mkdir(parents=True, exist_ok=True)
-    client = OpenAI(
+    cache = open_cache(cache, output_path)
+    metrics = open_metrics(metrics, output_path, f"{rule_path.stem}_{METRICS_NAME}")
+
+    # Every answer is appended to the journal as it arrives, so an interrupted run can be resumed
+    journal = ResultJournal(output_path / f"{rule_path.stem}_journal.jsonl", resume=resume)
+    client = make_client(
+    endpoints=endpoints,  # Several hosts are routed with model affinity
     base_url="http://ollama:11434/v1/",  # Ensure this URL is correct
     api_key="ollama"  # Replace with the actual API key
 )   
 
     torch.manual_seed(0)
-    for model in models:
-        print(f"Processing model: {model}")
-        answers = []  # To store model's answers
-
-        # Iterate through prompts
-        for ix in tqdm(range(rule.shape[0]), desc=f"Evaluating prompts for {model}"):
-            try:
-                
-                # Get the prompt and clean unnecessary spaces
-                prompt = rule["Prompt"].iloc[ix].strip()
-                context, question = prompt.split("\n\n", 1)  # Split prompt into context and question
-                
-                # Format messages
-                messages = [
-                    {"role": "system", "content": f"Answer only in 'Yes' or 'No'\nContext: {context}"},
-                    {"role": "user", "content": f"Question: {question}"}
-                ]
+    if hf_token and backend == "local":  # only the local backend downloads models from HuggingFace
+        login(token=hf_token)
 
-                # Get response from the model
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=5  # Limit tokens to get concise Yes/No output
-                )
+    if stream:
+        # Cut generation once a verdict is parsed instead of truncating every answer
+        decoding = {"stream": True, "token_budget": token_budget, "time_budget": time_budget}
+    else:
+        decoding = {"max_tokens": 5}  # Limit tokens to get concise Yes/No output
 
-                # Extract and store the answer
-                answer = response.choices[0].message.content.strip()
+    if chunksize:
+        answer_in_chunks(client, rule_path, models, output_path, chunksize, backend=backend, hf_token=hf_token,
+                         batch_size=batch_size, candidate_batch_size=candidate_batch_size, concurrency=concurrency,
+                         cache=cache, journal=journal, retries=retries, metrics=metrics, **decoding)
+    else:
+        # Load the rules and format messages once, they are shared by all models
+        rule = pd.read_csv(rule_path)
+        contexts, questions, message_lists = format_messages(rule)
 
-                answers.append(answer)
+        for model in models:
+            print(f"Processing model: {model}")
 
-            except Exception as e:
-                print(f"Error for prompt {ix} with model {model}: {e}")
-                answers.append("Error")
+            answers, confidences = get_model_answers(client, model, contexts, questions, message_lists, backend=backend,
+                                                     hf_token=hf_token, batch_size=batch_size,
+                                                     candidate_batch_size=candidate_batch_size, concurrency=concurrency,
+                                                     cache=cache, journal=journal, retries=retries, metrics=metrics,
+                                                     **decoding)
+            if confidences is not None:
+                rule[f"{model}_confidence"] = confidences
 
-        # Add answers as a column to the DataFrame
-        rule[model] = answers
+            # Add answers as a column to the DataFrame
+            rule[model] = answers
 
-        # Save intermediate results for the current model
-        rule.to_csv(output_path / f"{rule_path.stem}_{model}.csv", index=False)
-        print(f"Results saved for model {model} to {output_path / f'{rule_path.stem}_{model}.csv'}")
+            # Save intermediate results for the current model
+            rule.to_csv(output_path / f"{rule_path.stem}_{model}.csv", index=False)
+            print(f"Results saved for model {model} to {output_path / f'{rule_path.stem}_{model}.csv'}")
 
-    # Remove the "Prompt" column as it is no longer needed
-    rule.drop(columns=["Prompt"], inplace=True)
+        # Remove the "Prompt" column as it is no longer needed
+        rule.drop(columns=["Prompt"], inplace=True)
 
-    # Save the final results
-    rule.to_csv(output_path / f"{rule_path.stem}_final.csv", index=False)
-    print(f"Final results saved to {output_path / f'{rule_path.stem}_final.csv'}")
+        # Save the final results
+        rule.to_csv(output_path / f"{rule_path.stem}_final.csv", index=False)
+        print(f"Final results saved to {output_path / f'{rule_path.stem}_final.csv'}")
+    journal.close()
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+    if metrics is not None:
+        metrics.write()
 
 
 # Example
@@ -86,5 +231,18 @@ def auto_LLMs(rule_path: str, models: list, output_path: str):
 rule_path = "/home/jovyan/work/persistent/LLM_prompting/data/prompts/German.csv"
 models = ["qwen2.5-coder:0.5b"]
 output_path = "/home/jovyan/work/persistent/LLM_prompting/data/answers"
-auto_LLMs(rule_path=rule_path, models=models, hf_token=hf_token, output_path=output_path)
+auto_LLMs(rule_path=rule_path, models=models, output_path=output_path, concurrency={"qwen2.5-coder:0.5b": 8}, cache=True)
+
+# Routing across several Ollama hosts
+auto_LLMs(rule_path=rule_path, models=models, output_path=output_path, concurrency=8,
+          endpoints=["http://gpu1:11434/v1/", "http://gpu2:11434/v1/"])
+
+# Asking about 10 candidate classes per request
+auto_LLMs(rule_path=rule_path, models=models, output_path=output_path, concurrency=4, candidate_batch_size=10)
+
+# Very large prompt files, 100000 prompts in memory at a time
+auto_LLMs(rule_path=rule_path, models=models, output_path=output_path, concurrency=8, chunksize=100000)
+
+# In-process, with Yes/No probabilities
+auto_LLMs(rule_path=rule_path, models=["Qwen/Qwen2.5-1.5B-Instruct"], output_path=output_path, backend="local", batch_size=16)
 """
\ No newline at end of file
@@ -0,0 +1,109 @@
+import re
+from llm_engine import run_prompts, strip_reasoning
+
+BATCH_ANSWER_PATTERN = re.compile(r"^\W*(\d+)\s*[:.)\-]\s*\W*(yes|no)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def single_messages(context: str, question: str) -> list:
+    """
+    Formats one candidate's context and question as chat messages, as auto_LLMs does.
+    """
+    return [
+        {"role": "system", "content": f"Answer only in 'Yes' or 'No'\nContext: {context}"},
+        {"role": "user", "content": f"Question: {question}"}
+    ]
+
+
+def batch_messages(context: str, questions: list) -> list:
+    """
+    Formats several candidates' questions sharing one context as a single request with numbered questions.
+    """
+    numbered = "\n".join(f"{number}. {question}" for number, question in enumerate(questions, start=1))
+    return [
+        {"role": "system", "content": (
+            "Answer each numbered question only in 'Yes' or 'No', one line per question, "
+            f"formatted as '<number>: Yes' or '<number>: No'.\nContext: {context}")},
+        {"role": "user", "content": f"Questions:\n{numbered}"}
+    ]
+
+
+def parse_batch_answer(answer: str, count: int):
+    """
+    Parses a numbered answer into one "Yes"/"No" per question, ignoring <think>...</think> reasoning.
+
+    Returns:
+        The answers in question order, or None if any question is missing or answered twice differently (list).
+    """
+    parsed = {}
+    for number, verdict in BATCH_ANSWER_PATTERN.findall(strip_reasoning(answer or "")):
+        number = int(number)
+        verdict = verdict.capitalize()
+        if number in parsed and parsed[number] != verdict:
+            return None
+        parsed[number] = verdict
+    if any(number not in parsed for number in range(1, count + 1)):
+        return None
+    return [parsed[number] for number in range(1, count + 1)]
+
+
+def run_candidate_batches(client, model: str, contexts: list, questions: list, batch_size: int, row_ids=None,
+                          max_tokens_per_answer=5, **kwargs) -> list:
+    """
+    Answers candidate-class prompts with one request per `batch_size` candidates sharing the same context
+    (i.e. the same rule constant), falling back to single-candidate requests for batches whose answer cannot be parsed.
+
+    Args:
+        client (OpenAI): An OpenAI-compatible client.
+        model (str): The model name.
+        contexts (list): The context of each prompt, None for prompts that could not be formatted.
+        questions (list): The question of each prompt.
+        batch_size (int): Maximum number of candidates per request.
+        row_ids (list): Identifiers of the prompts, their positions by default.
+        max_tokens_per_answer (int): Output tokens allowed per candidate.
+        **kwargs: Passed on to `run_prompts` (concurrency, cache, journal).
+
+    Returns:
+        The answers, one per prompt and in prompt order (list).
+    """
+    row_ids = list(range(len(contexts))) if row_ids is None else list(row_ids)
+    answers = ["Error"] * len(contexts)
+
+    # Group consecutive prompts with the same context, then cut the groups into batches
+    batches = []
+    for ix, context in enumerate(contexts):
+        if context is None:
+            continue
+        if batches and contexts[batches[-1][-1]] == context and batches[-1][-1] == ix - 1 and len(batches[-1]) < batch_size:
+            batches[-1].append(ix)
+        else:
+            batches.append([ix])
+
+    responses = run_prompts(
+        client, model,
+        [batch_messages(contexts[batch[0]], [questions[ix] for ix in batch]) for batch in batches],
+        row_ids=[f"batch:{row_ids[batch[0]]}-{row_ids[batch[-1]]}" for batch in batches],
+        max_tokens=max_tokens_per_answer * batch_size + 10,
+        desc=f"Evaluating candidate batches for {model}",
+        **kwargs)
+
+    fallback = []
+    for batch, response in zip(batches, responses):
+        parsed = parse_batch_answer(response, len(batch))
+        if parsed is None:
+            fallback.extend(batch)
+            continue
+        for ix, answer in zip(batch, parsed):
+            answers[ix] = answer
+
+    if fallback:
+        print(f"{len(fallback)} candidates of {model} could not be parsed from batched answers, asking them one by one")
+        single = run_prompts(
+            client, model,
+            [single_messages(contexts[ix], questions[ix]) for ix in fallback],
+            row_ids=[row_ids[ix] for ix in fallback],
+            max_tokens=max_tokens_per_answer,
+            **kwargs)
+        for ix, answer in zip(fallback, single):
+            answers[ix] = answer
+
+    return answers
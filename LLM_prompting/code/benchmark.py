@@ -0,0 +1,144 @@
+from pathlib import Path
+import json
+import time
+import pandas as pd
+from fake_llm_server import start_fake_server
+from llm_metrics import RequestMetrics
+from prompt_store import PROMPT_STORE_NAME, write_prompt_store
+
+PIPELINES = ("auto_LLMs", "serial_LLMs", "desc_llm")
+
+
+def make_dataset(pipeline: str, size: int, path: Path) -> Path:
+    """
+    Writes a synthetic input of `size` prompts for a pipeline and returns its path.
+
+    Args:
+        The pipeline, one of PIPELINES (pipeline: str) ,
+        Number of prompts (size: int) ,
+        Folder the input is written to (path: Path) .
+
+    Returns:
+        The rule prompts CSV, prompt store folder or rules CSV the pipeline reads (path: Path) .
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    if pipeline == "auto_LLMs":
+        data_path = path / "benchmark_rule.csv"
+        pd.DataFrame({
+            "Rule": 1,
+            "Rule_Constant": "Benchmark",
+            "Candidate_Class": [f"Class_{ix}" for ix in range(size)],
+            "Prompt": [f"Benchmark is a class.\n\nIs Class_{ix} disjoint with Benchmark?" for ix in range(size)],
+        }).to_csv(data_path, index=False)
+        return data_path
+    if pipeline == "serial_LLMs":
+        records = ({"rule_id": ix, "head": f"hasAgeGroup(X,group{ix % 3})", "body": f"hasCode(ICD9:{ix},X)",
+                    "code": f"ICD9:{ix}", "code_desc": "Benchmark code",
+                    "prompt": f"Is the rule hasAgeGroup(X,group{ix % 3}) <= hasCode(ICD9:{ix},X) plausible?"}
+                   for ix in range(size))
+        write_prompt_store(records, path / PROMPT_STORE_NAME)
+        return path
+    if pipeline == "desc_llm":
+        data_path = path / "benchmark_rules.csv"
+        pd.DataFrame({"Rule_With_Descriptions": [f"hasCode(X,ICD9:{ix}) => hasAgeGroup(X,group{ix % 3})"
+                                                 for ix in range(size)]}).to_csv(data_path, index=False)
+        return data_path
+    raise ValueError(f"Unknown pipeline {pipeline}, expected one of {PIPELINES}.")
+
+
+def run_pipeline(pipeline: str, data_path: Path, models: list, output_path: Path, base_url: str, concurrency,
+                 retries: int, metrics: RequestMetrics, **options):
+    """
+    Runs one pipeline on its synthetic input against the server at `base_url`.
+    """
+    # Pipelines are imported when used, auto_LLMs needs torch and transformers
+    if pipeline == "auto_LLMs":
+        from auto_LLMs import auto_LLMs
+        auto_LLMs(data_path, models, output_path, concurrency=concurrency, endpoints=[base_url], retries=retries,
+                  metrics=metrics, **options)
+    elif pipeline == "serial_LLMs":
+        from serial_LLMs import auto_LLMs as serial_auto_LLMs
+        output_path.mkdir(parents=True, exist_ok=True)
+        serial_auto_LLMs(data_path, models, output_path, concurrency=concurrency, endpoints=[base_url],
+                         retries=retries, metrics=metrics, **options)
+    elif pipeline == "desc_llm":
+        from desc_llm import evaluate_rules_with_llms
+        evaluate_rules_with_llms(data_path, models, output_path / "desc_output.csv", concurrency=concurrency,
+                                 endpoints=[base_url], retries=retries, metrics=metrics, **options)
+    else:
+        raise ValueError(f"Unknown pipeline {pipeline}, expected one of {PIPELINES}.")
+
+
+def run_benchmark(output_path: str, pipelines=PIPELINES, sizes=(100, 1000), concurrencies=(1, 8),
+                  models=("fake-small", "fake-large"), retries=2, server_options=None, **options) -> pd.DataFrame:
+    """
+    Runs each pipeline against a local fake chat completions server for every dataset size and concurrency setting,
+    and records per-request metrics for every run.
+
+    Args:
+        Folder where inputs, answers and metrics are written (output_path: str) ,
+        Pipelines to run, all of PIPELINES by default (pipelines: list) ,
+        Numbers of prompts per run (sizes: list) ,
+        Concurrency settings to compare, each an int or a {model: int} mapping (concurrencies: list) ,
+        Model names sent to the fake server (models: list) ,
+        Number of retries of failed requests (retries: int) ,
+        Options of the fake server, e.g. {"latency": 0.1, "failure_rate": 0.05, "think_rate": 0.5} (server_options: dict) ,
+        Further options passed to every pipeline, e.g. stream=True (options) .
+
+    Returns:
+        One row per run with its wall time, throughput, error, retry and latency totals, also written to
+        benchmark.csv and benchmark.json in the output folder (DataFrame) .
+    """
+    output_path = Path(output_path)
+    server, base_url = start_fake_server(**(server_options or {}))
+    print(f"Fake chat completions server at {base_url}")
+
+    rows = []
+    try:
+        for pipeline in pipelines:
+            for size in sizes:
+                data_path = make_dataset(pipeline, size, output_path / "data" / f"{pipeline}_{size}")
+                for concurrency in concurrencies:
+                    label = concurrency if not isinstance(concurrency, dict) else json.dumps(concurrency, sort_keys=True)
+                    run_path = output_path / "runs" / f"{pipeline}_n{size}_c{label}"
+                    metrics = RequestMetrics(run_path / "llm_metrics")
+                    print(f"Running {pipeline} on {size} prompts with concurrency {label}")
+
+                    started = time.perf_counter()
+                    run_pipeline(pipeline, data_path, list(models), run_path, base_url, concurrency, retries, metrics,
+                                 **options)
+                    wall_time = time.perf_counter() - started  # the pipeline wrote the run's metrics files
+
+                    records = metrics.to_frame()
+                    requests = records[records["source"] == "request"]
+                    rows.append({
+                        "pipeline": pipeline,
+                        "size": size,
+                        "concurrency": label,
+                        "models": len(models),
+                        "prompts": len(records),
+                        "wall_time": wall_time,
+                        "throughput": len(records) / wall_time if wall_time > 0 else None,
+                        "errors": int((records["status"] != "ok").sum()),
+                        "retries": int(records["retries"].sum()),
+                        "cache_hits": int((records["source"] == "cache").sum()),
+                        "latency_p50": requests["latency"].quantile(0.5) if len(requests) else None,
+                        "latency_p95": requests["latency"].quantile(0.95) if len(requests) else None,
+                        "completion_tokens": int(pd.to_numeric(requests["completion_tokens"]).sum()),
+                    })
+    finally:
+        server.shutdown()
+
+    results = pd.DataFrame(rows)
+    results.to_csv(output_path / "benchmark.csv", index=False)
+    with open(output_path / "benchmark.json", "w") as f:
+        json.dump({"server_options": server_options or {}, "retries": retries, "runs": rows}, f, indent=1, default=str)
+    print(f"Benchmark results saved to {output_path / 'benchmark.csv'}")
+    return results
+
+
+if __name__ == "__main__":
+    # Compare sequential and parallel prompting of the lightweight pipelines on a slightly flaky, slow server
+    print(run_benchmark("benchmark_results", pipelines=("serial_LLMs", "desc_llm"), sizes=(100, 1000),
+                        concurrencies=(1, 8), server_options={"latency": 0.05, "jitter": 0.2, "failure_rate": 0.01,
+                                                              "think_rate": 0.25}))
@@ -0,0 +1,90 @@
+from pathlib import Path
+import hashlib
+import json
+import time
+
+MANIFEST_NAME = "manifest.json"
+
+
+def content_hash(*parts) -> str:
+    """
+    Returns a short hash of JSON-serializable inputs (template, data section, model, decoding parameters, messages, ...).
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class BuildManifest:
+    """
+    Records the hash of the inputs each pipeline output was built from, so a later run only rebuilds the outputs
+    whose inputs changed, and reports what the last run rebuilt versus reused.
+
+    The manifest is a JSON file with, per stage (e.g. "prompts" or "answers"), the input hash(es) of every output key,
+    and the rebuilt and reused counts of the last run.
+
+    Args:
+        path (str or Path): Path to the manifest file, loaded if it exists.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.inputs = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.inputs = json.load(f).get("inputs", {})
+        self.last_run = {}
+
+    def get(self, stage: str, key: str):
+        """
+        Returns the input hash(es) recorded for an output by a previous run, or None.
+        """
+        return self.inputs.get(stage, {}).get(key)
+
+    def update(self, stage: str, key: str, input_hash, rebuilt: int = 1, reused: int = 0):
+        """
+        Records the input hash(es) of an output and how many of its parts were rebuilt and reused in this run.
+        """
+        self.inputs.setdefault(stage, {})[key] = input_hash
+        self.last_run.setdefault(stage, {})[key] = {"rebuilt": rebuilt, "reused": reused}
+
+    def keys(self, stage: str) -> list:
+        return list(self.inputs.get(stage, {}))
+
+    def forget(self, stage: str, key: str):
+        """
+        Drops an output whose inputs no longer exist.
+        """
+        self.inputs.get(stage, {}).pop(key, None)
+        self.last_run.setdefault(stage, {})[key] = {"rebuilt": 0, "reused": 0, "removed": True}
+
+    def summary(self) -> dict:
+        """
+        Returns the total rebuilt, reused and removed counts of this run per stage.
+        """
+        totals = {}
+        for stage, entries in self.last_run.items():
+            totals[stage] = {
+                "rebuilt": sum(entry["rebuilt"] for entry in entries.values()),
+                "reused": sum(entry["reused"] for entry in entries.values()),
+                "removed": sum(entry.get("removed", False) for entry in entries.values()),
+            }
+        return totals
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"updated": time.strftime("%Y-%m-%d %H:%M:%S"), "last_run": self.last_run,
+                       "summary": self.summary(), "inputs": self.inputs}, f, indent=1)
+
+
+def open_manifest(manifest, output_path):
+    """
+    Returns a BuildManifest for `manifest`: True for MANIFEST_NAME in `output_path`, a path, an existing
+    BuildManifest, or None (no incremental rebuild).
+    """
+    if manifest is None or manifest is False:
+        return None
+    if manifest is True:
+        return BuildManifest(Path(output_path) / MANIFEST_NAME)
+    if isinstance(manifest, BuildManifest):
+        return manifest
+    return BuildManifest(manifest)
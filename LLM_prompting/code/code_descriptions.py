@@ -0,0 +1,99 @@
+from pathlib import Path
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+NO_DESCRIPTION = "No description available"
+
+
+@lru_cache(maxsize=None)
+def load_icd9_index(desc: Path) -> dict:
+    """
+    Loads the ICD-9 diagnosis descriptions once as a hash index.
+
+    Args:
+        Path to the ICD-9 code descriptions from MIMIC-III named D_ICD_DIAGNOSES.csv (desc: pathlib Path object) .
+
+    Returns:
+        A mapping of ICD-9 code to its long title (icd9_index: dict) .
+    """
+    table = pd.read_csv(desc, dtype={"ICD9_CODE": str}, usecols=["ICD9_CODE", "LONG_TITLE"])
+    table = table.dropna(subset=["ICD9_CODE"]).drop_duplicates(subset="ICD9_CODE", keep="first")  # first row wins, as in a linear scan
+    return dict(zip(table["ICD9_CODE"], table["LONG_TITLE"]))
+
+
+@lru_cache(maxsize=None)
+def load_cpt_index(desc: Path) -> tuple:
+    """
+    Loads the CPT subsection ranges once as a sorted interval index.
+
+    Args:
+        Path to the CPT code descriptions from MIMIC-III named D_CPT.csv (desc: pathlib Path object) .
+
+    Returns:
+        The range starts, range ends (inclusive), running maximum of the ends, original row order and
+        subsection headers, all sorted by range start (cpt_index: tuple of numpy arrays) .
+    """
+    table = pd.read_csv(desc, usecols=["MINCODEINSUBSECTION", "MAXCODEINSUBSECTION", "SUBSECTIONHEADER"])
+    table = table.dropna(subset=["MINCODEINSUBSECTION", "MAXCODEINSUBSECTION"])
+    table["ROW"] = np.arange(len(table))
+    table = table.sort_values(["MINCODEINSUBSECTION", "ROW"], kind="stable")
+
+    starts = table["MINCODEINSUBSECTION"].to_numpy(dtype=np.int64)
+    ends = table["MAXCODEINSUBSECTION"].to_numpy(dtype=np.int64)
+    return starts, ends, np.maximum.accumulate(ends), table["ROW"].to_numpy(), table["SUBSECTIONHEADER"].to_numpy()
+
+
+def lookup_cpt(code, cpt_index: tuple) -> str:
+    """
+    Finds the subsection header of a single CPT code by bisecting the interval index.
+    When subsections overlap, the one listed first in D_CPT.csv is returned.
+    """
+    try:
+        code = int(code)
+    except (TypeError, ValueError):  # e.g. category II/III codes such as 0001F
+        return NO_DESCRIPTION
+
+    starts, ends, max_ends, rows, headers = cpt_index
+    best = None
+    ix = int(np.searchsorted(starts, code, side="right")) - 1
+    # Only intervals whose running maximum end still covers the code can contain it
+    while ix >= 0 and max_ends[ix] >= code:
+        if ends[ix] >= code and (best is None or rows[ix] < rows[best]):
+            best = ix
+        ix -= 1
+
+    return headers[best] if best is not None else NO_DESCRIPTION
+
+
+def describe_codes(codes: pd.Series, diagnosis_descriptions_path: Path, procedure_descriptions_path: Path) -> pd.Series:
+    """
+    Resolves the descriptions of all codes of a rule table in one call.
+
+    Args:
+        Codes prefixed with their vocabulary, e.g. "ICD9:4019" or "CPT:99213", anything else is left undescribed (codes: pandas Series) ,
+        Path to D_ICD_DIAGNOSES.csv (diagnosis_descriptions_path: pathlib Path object) ,
+        Path to D_CPT.csv (procedure_descriptions_path: pathlib Path object) .
+
+    Returns:
+        The description of each code, aligned with the input (code_desc: pandas Series) .
+    """
+    codes = codes.astype("string")
+    vocab = codes.str.split(":", n=1).str[0]
+    value = codes.str.split(":", n=1).str[1].str.strip()
+    code_desc = pd.Series(NO_DESCRIPTION, index=codes.index, dtype=object)
+
+    is_icd = (vocab == "ICD9").fillna(False).astype(bool)
+    if is_icd.any():
+        icd9_index = load_icd9_index(Path(diagnosis_descriptions_path))
+        code_desc[is_icd] = value[is_icd].map(icd9_index).fillna(NO_DESCRIPTION).astype(object)
+
+    is_cpt = (vocab == "CPT").fillna(False).astype(bool)
+    if is_cpt.any():
+        cpt_index = load_cpt_index(Path(procedure_descriptions_path))
+        # Resolve each distinct code once
+        unique_codes = value[is_cpt].unique()
+        resolved = {code: lookup_cpt(code, cpt_index) for code in unique_codes}
+        code_desc[is_cpt] = value[is_cpt].map(resolved).astype(object)
+
+    return code_desc
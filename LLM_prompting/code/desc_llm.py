@@ -1,65 +1,128 @@
 from pathlib import Path
 import pandas as pd
-from tqdm import tqdm
-from openai import OpenAI
+from llm_router import make_client
 import re
+from llm_engine import run_prompts, run_cascade
+from llm_cache import open_cache
+from llm_journal import ResultJournal
+from llm_metrics import open_metrics
 
-def evaluate_rules_with_llms(rule_path: str, models: list, output_csv_path: str):
+def clean_answer(model: str, answer: str) -> str:
+    """
+    Removes the reasoning trace from a reasoning model's answer.
+
+    """
+    if model == "deepseek-r1:70b":
+        # Remove <think>...</think> completely
+        answer = re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip()
+    return answer
+
+def format_rule_messages(df: pd.DataFrame):
+    """
+    Formats each rule of a rules table as chat messages asking whether it is clinically relevant.
+
+    """
+    rule_texts = []
+    message_lists = []
+    for ix in range(df.shape[0]):
+        try:
+            rule_text = df["Rule_With_Descriptions"].iloc[ix].strip()
+            prompt = f"Horn rules are logical expressions consisting of a rule body (premises) and a rule head (conclusion), structured as implications. They follow the form: rel1(A,B) and rel3(B,C) => rel2(A,C). The left side of the arrow (antecedent) represents the rule body, containing one or more conditions that must be satisfied. The right side of the arrow (consequent) is the rule head, which follows if the body conditions hold. Each element follows the structure relation(subject, object), where relations define connections between entities. Is this rule '{rule_text}' clinically relevant? Answer only yes or no."
+
+            messages = [
+                {"role": "system", "content": "Answer only yes or no."},
+                {"role": "user", "content": prompt}
+            ]
+        except Exception as e:
+            print(f"Error on rule {ix}: {e}")
+            rule_text = df["Rule_With_Descriptions"].iloc[ix]
+            messages = None
+        rule_texts.append(rule_text)
+        message_lists.append(messages)
+    return rule_texts, message_lists
+
+def evaluate_rules_with_llms(rule_path: str, models: list, output_csv_path: str, concurrency=1, cache=None, resume=False,
+                             cascade=False, required_yes=None, stream=False, token_budget=None, time_budget=None,
+                             endpoints=None, chunksize=None, retries=2, metrics=None):
     """
     Evaluates each rule in a CSV file using multiple LLM models by asking whether the rule is clinically relevant.
+    Up to `concurrency` requests (an int, or a {model: int} mapping) are sent to each model in parallel.
+    With `cache` (True, a path, or a ResponseCache), answers from previous runs are reused instead of asked again.
+    Answers are journaled as they arrive; with `resume`, those of an interrupted run are kept.
+    With `cascade`, models are asked in the order of `models` (cheapest first) and a rule is no longer asked about
+    once `required_yes` models (all by default) said yes, or can no longer do so; skipped models answer "Skipped".
+    With `stream`, answers are streamed, normalized to Yes/No/NA and cut off as soon as a verdict is parsed;
+    `token_budget` and `time_budget` bound each request, e.g. for reasoning models.
+    With several `endpoints`, requests are routed across those hosts, keeping each model on the hosts that have it loaded.
+    With `chunksize`, rules are read and evaluated `chunksize` at a time and each chunk's answers are appended to the
+    output as soon as it completes, so memory stays bounded however many rules there are.
+    Failed requests are retried up to `retries` times. With `metrics` (True, a path, or a RequestMetrics), the timing,
+    token counts, retries, cache hits and error class of every prompt are written to llm_metrics.csv/.json.
 
     """
-    # Load the rules
+    # Load the rules, all at once or chunk by chunk
     rule_path = Path(rule_path)
-    df = pd.read_csv(rule_path)
+    chunks = pd.read_csv(rule_path, chunksize=chunksize) if chunksize else [pd.read_csv(rule_path)]
+    output_csv_path = Path(output_csv_path)
+    output_csv_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = open_cache(cache, output_csv_path.parent)
+    journal = ResultJournal(output_csv_path.with_suffix(".journal.jsonl"), resume=resume)
+    metrics = open_metrics(metrics, output_csv_path.parent)
     
     # Prepare AI client 
-    client = OpenAI(
+    client = make_client(
+        endpoints=endpoints,
         base_url="path", 
         api_key="ollama"
     )
-    
-    # Collect answers in a new list of dicts
-    output_data = []
-
-    for model in models:
-        print(f"Evaluating with model: {model}")
-        for ix in tqdm(range(df.shape[0]), desc=f"Processing model {model}"):
-            try:
-                rule_text = df["Rule_With_Descriptions"].iloc[ix].strip()
-                prompt = f"Horn rules are logical expressions consisting of a rule body (premises) and a rule head (conclusion), structured as implications. They follow the form: rel1(A,B) and rel3(B,C) => rel2(A,C). The left side of the arrow (antecedent) represents the rule body, containing one or more conditions that must be satisfied. The right side of the arrow (consequent) is the rule head, which follows if the body conditions hold. Each element follows the structure relation(subject, object), where relations define connections between entities. Is this rule '{rule_text}' clinically relevant? Answer only yes or no."
-                
-                messages = [
-                    {"role": "system", "content": "Answer only yes or no."},
-                    {"role": "user", "content": prompt}
-                ]
-
-                # Generate the response
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages
-                )
-                answer = response.choices[0].message.content.strip()
-
-                if model == "deepseek-r1:70b":
-                    # Remove <think>...</think> completely
-                    answer = re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip()
-
-                output_data.append({"rule": rule_text, "model": model, "answer": answer})
-            except Exception as e:
-                print(f"Error on rule {ix} with model {model}: {e}")
-                output_data.append({"rule": rule_text, "model": model, "answer": "Error"})
-
-    # Create DataFrame and save
-    output_df = pd.DataFrame(output_data)
-    output_csv_path = Path(output_csv_path)
-    output_csv_path.parent.mkdir(parents=True, exist_ok=True)
-    output_df.to_csv(output_csv_path, index=False)
+
+    decoding = {"stream": True, "token_budget": token_budget, "time_budget": time_budget} if stream else {}
+
+    start = 0
+    for chunk_ix, df in enumerate(chunks):
+        # Format messages once, they are shared by all models
+        rule_texts, message_lists = format_rule_messages(df)
+        # Rows keep their position in the whole file, so journals are shared between chunked and unchunked runs
+        row_ids = list(range(start, start + len(message_lists)))
+        start += len(message_lists)
+
+        if cascade:
+            print(f"Evaluating with models in cascade: {models}")
+            results = run_cascade(client, models, message_lists, required_yes=required_yes, clean=clean_answer,
+                                  concurrency=concurrency, cache=cache, journal=journal, row_ids=row_ids,
+                                  retries=retries, metrics=metrics, **decoding)
+        else:
+            results = {}
+            for model in models:
+                print(f"Evaluating with model: {model}")
+
+                # Generate the responses
+                answers = run_prompts(client, model, message_lists, concurrency=concurrency, cache=cache, journal=journal, row_ids=row_ids, retries=retries, metrics=metrics, desc=f"Processing model {model}", **decoding)
+                results[model] = [clean_answer(model, answer) for answer in answers]
+
+        # Append this chunk's answers, one row per rule and model
+        output_df = pd.DataFrame({
+            "rule": [rule_text for _ in models for rule_text in rule_texts],
+            "model": [model for model in models for _ in rule_texts],
+            "answer": [answer for model in models for answer in results[model]],
+        })
+        output_df.to_csv(output_csv_path, mode="w" if chunk_ix == 0 else "a", header=chunk_ix == 0, index=False)
+
     print(f"Output saved to: {output_csv_path}")
+    journal.close()
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+    if metrics is not None:
+        metrics.write()
+
 
+# Example (not run when imported)
+if __name__ == "__main__":
+    rule_path = "/app/filtered_unmatchedrules_with_descriptions.csv"
+    models = ["llama3.2:latest", "mistral", "llama3.1:70b", "deepseek-r1:70b"] # cheapest first for the cascade
+    output_csv_path = "/app/answers/desc_output.csv"
 
-rule_path = "/app/filtered_unmatchedrules_with_descriptions.csv"
-models = ["llama3.2:latest", "llama3.1:70b", "deepseek-r1:70b", "mistral"]
-output_csv_path = "/app/answers/desc_output.csv"
+    concurrency = {"llama3.2:latest": 8, "mistral": 8, "default": 2}
 
-evaluate_rules_with_llms(rule_path, models, output_csv_path)
\ No newline at end of file
+    evaluate_rules_with_llms(rule_path, models, output_csv_path, concurrency=concurrency, cache=True, cascade=True,
+                             stream=True, token_budget=2048, time_budget=120)
@@ -1,18 +1,22 @@
 import pandas as pd
 
-# Load the CSV
-input_path = "/app/answers/desc_output.csv" 
-df = pd.read_csv(input_path)
-
-# Group by rule
-qualified_rules = []
-
-for rule, group in df.groupby("rule"):
-    models_with_yes = group[group["answer"].str.lower() == "yes"]["model"].nunique()
-    
-    # If all 4 models said "yes", keep the rule
-    if models_with_yes == 4:
-        qualified_rules.append(rule)
+# Load the CSV in chunks, so the answers of any number of rules fit in memory
+input_path = "/app/answers/desc_output.csv"
+chunksize = 100000
+
+# Number of models that must say "yes", same as required_yes in desc_llm.py (all 4 models by default)
+required_yes = 4
+
+# Count, per rule, the models that said "yes" (models skipped by the cascade answered "Skipped")
+yes_votes = {}
+
+for chunk in pd.read_csv(input_path, chunksize=chunksize):
+    said_yes = chunk[(chunk["answer"].astype(str).str.lower() == "yes") & chunk["rule"].notna()]
+    for rule, model in zip(said_yes["rule"], said_yes["model"]):
+        yes_votes.setdefault(rule, set()).add(model)
+
+# If enough models said "yes", keep the rule
+qualified_rules = sorted(rule for rule, models in yes_votes.items() if len(models) >= required_yes)
 
 
 result_df = pd.DataFrame(qualified_rules, columns=["rule"])
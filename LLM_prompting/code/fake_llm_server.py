@@ -0,0 +1,182 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+
+class FakeLLMConfig:
+    """
+    Behaviour of the fake chat completions server.
+
+    Args:
+        latency (float): Seconds before the first token of every answer.
+        token_latency (float): Seconds between streamed tokens, also added per token to non-streamed answers.
+        jitter (float): Relative random variation of both latencies, e.g. 0.2 for +/-20%.
+        failure_rate (float): Fraction of requests answered with an HTTP error instead of a completion.
+        failure_status (int): HTTP status of failed requests.
+        think_rate (float): Fraction of answers starting with a <think>...</think> reasoning trace.
+        think_tokens (int): Number of tokens in a reasoning trace.
+        yes_rate (float): Fraction of "Yes" verdicts, the others are "No".
+        seed (int): Random seed, None for a different sequence every run.
+    """
+
+    def __init__(self, latency: float = 0.05, token_latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 failure_status: int = 503, think_rate: float = 0.0, think_tokens: int = 50, yes_rate: float = 0.5,
+                 seed=0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.think_rate = think_rate
+        self.think_tokens = think_tokens
+        self.yes_rate = yes_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        # The random draws of one request, taken together so concurrent requests stay reproducible per request order
+        with self.lock:
+            return {
+                "fail": self.random.random() < self.failure_rate,
+                "think": self.random.random() < self.think_rate,
+                "yes": self.random.random() < self.yes_rate,
+                "scale": 1 + self.jitter * (2 * self.random.random() - 1),
+            }
+
+
+def answer_tokens(draw: dict, think_tokens: int) -> list:
+    """
+    Returns the answer of a request as a list of streamed tokens.
+    """
+    tokens = []
+    if draw["think"]:
+        tokens += ["<think>"] + [" hmm"] * think_tokens + ["</think>", "\n\n"]
+    return tokens + ["Yes" if draw["yes"] else "No", "."]
+
+
+def count_tokens(messages: list) -> int:
+    # Rough whitespace token count of the prompt
+    return sum(len(str(message.get("content", "")).split()) for message in messages)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """
+    Serves POST /v1/chat/completions (streamed or not), GET /v1/models and Ollama's GET /api/ps.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # no access log
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        models = sorted(self.server.models_seen)
+        if self.path.rstrip("/").endswith("/api/ps"):
+            self.send_json(200, {"models": [{"name": model} for model in models]})
+        elif self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": model, "object": "model"} for model in models]})
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.server.config
+        draw = config.draw()
+        model = request.get("model", "fake")
+        self.server.models_seen.add(model)
+
+        time.sleep(config.latency * draw["scale"])
+        if draw["fail"]:
+            self.send_json(config.failure_status, {"error": {"message": "simulated failure", "type": "server_error"}})
+            return
+
+        tokens = answer_tokens(draw, config.think_tokens)
+        if request.get("max_tokens"):
+            tokens = tokens[:request["max_tokens"]]
+        prompt_tokens = count_tokens(request.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not request.get("stream"):
+            time.sleep(config.token_latency * draw["scale"] * len(tokens))
+            self.send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                          "total_tokens": prompt_tokens + len(tokens)},
+            })
+            return
+
+        # Server-sent events, one chunk per token; a client that cancels simply closes the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(config.token_latency * draw["scale"])
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **config):
+    """
+    Starts a fake OpenAI-compatible chat completions server in a background thread.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on, 0 for any free port.
+        **config: Options of FakeLLMConfig (latency, failure_rate, think_rate, ...).
+
+    Returns:
+        The server, to be stopped with `server.shutdown()`, and its base URL for OpenAI clients (tuple).
+    """
+    server = ThreadingHTTPServer((host, port), FakeLLMHandler)
+    server.daemon_threads = True
+    server.config = FakeLLMConfig(**config)
+    server.models_seen = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--think-rate", type=float, default=0.0)
+    parser.add_argument("--think-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.host, args.port, latency=args.latency, token_latency=args.token_latency,
+                                         jitter=args.jitter, failure_rate=args.failure_rate,
+                                         think_rate=args.think_rate, think_tokens=args.think_tokens)
+    print(f"Serving fake chat completions at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,137 @@
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of LLM answers, stored in a SQLite file.
+
+    Entries are keyed on a hash of the model name, the full message list and the decoding
+    parameters (e.g. max_tokens, seed), so a rerun only pays for prompts that actually changed.
+
+    Args:
+        path (str or Path): Path to the SQLite file, created if missing.
+        max_entries (int): Maximum number of cached answers, least recently used ones are evicted. None for no limit.
+        read_only (bool): If True, the cache is only read from and never written to. A read-only cache whose file does
+            not exist yet is empty.
+    """
+
+    def __init__(self, path, max_entries=None, read_only=False):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if read_only and not self.path.exists():
+            print(f"Response cache {self.path} does not exist, every request is a miss")
+            self._conn = None
+            return
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        uri = f"file:{self.path}?mode=ro" if read_only else f"file:{self.path}"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if not read_only:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, answer TEXT, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list, **params) -> str:
+        """
+        Returns the content hash identifying a request.
+
+        Args:
+            model (str): The model name.
+            messages (list): The chat messages of the request.
+            **params: The decoding parameters of the request.
+
+        Returns:
+            The hex digest of the request (str).
+        """
+        payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, messages: list, **params):
+        """
+        Returns the cached answer for a request, or None if it was never answered.
+        """
+        key = self.make_key(model, messages, **params)
+        with self._lock:
+            if self._conn is None:
+                self.misses += 1
+                return None
+            row = self._conn.execute("SELECT answer FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        return row[0]
+
+    def put(self, model: str, messages: list, answer: str, **params):
+        """
+        Stores the answer for a request, evicting the least recently used entries past `max_entries`.
+        """
+        if self.read_only:
+            return
+        key = self.make_key(model, messages, **params)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, answer, last_used) VALUES (?, ?, ?, ?)",
+                (key, model, answer, time.time()),
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            if self._conn is None:
+                return 0
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters of this session.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+def open_cache(cache, output_path):
+    """
+    Resolves the `cache` argument accepted by the prompting functions.
+
+    Args:
+        cache (None, bool, str, Path or ResponseCache): None or False disables caching, True uses
+            "llm_cache.sqlite" under the output directory, a path opens that file.
+        output_path (Path): The output directory of the prompting run.
+
+    Returns:
+        The response cache, or None (ResponseCache).
+    """
+    if cache is None or cache is False:
+        return None
+    if isinstance(cache, ResponseCache):
+        return cache
+    if cache is True:
+        return ResponseCache(Path(output_path) / "llm_cache.sqlite")
+    return ResponseCache(cache)
@@ -0,0 +1,303 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import re
+import time
+from tqdm import tqdm
+
+VERDICT_PATTERN = re.compile(r"^\W*(yes|no|n/?a)(?=\W|$)", re.IGNORECASE)
+
+
+def resolve_concurrency(concurrency, model: str) -> int:
+    """
+    Returns the number of parallel requests allowed for a model.
+
+    Args:
+        concurrency (int or dict): Either a single limit for all models, or a mapping of model name to limit.
+            A "default" key in the mapping is used for models that are not listed.
+        model (str): The model name.
+
+    Returns:
+        The concurrency limit for the model, at least 1 (int).
+    """
+    if isinstance(concurrency, dict):
+        concurrency = concurrency.get(model, concurrency.get("default", 1))
+    return max(1, int(concurrency or 1))
+
+
+def get_answer(client, model: str, messages: list, usage=None, **params) -> str:
+    """
+    Sends a single chat completion request and returns the stripped answer text.
+
+    Args:
+        client (OpenAI): An OpenAI-compatible client.
+        model (str): The model name.
+        messages (list): The chat messages to send.
+        usage (dict): If given, filled with the prompt and completion token counts reported by the server.
+        **params: Additional decoding parameters passed to the completion call (e.g. max_tokens).
+
+    Returns:
+        The model's answer (str).
+    """
+    response = client.chat.completions.create(model=model, messages=messages, **params)
+    if usage is not None and getattr(response, "usage", None) is not None:
+        usage["prompt_tokens"] = response.usage.prompt_tokens
+        usage["completion_tokens"] = response.usage.completion_tokens
+    return response.choices[0].message.content.strip()
+
+
+def strip_reasoning(text: str) -> str:
+    """
+    Removes <think>...</think> reasoning from an answer, including a trace that was cut off before </think>.
+    """
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    return re.sub(r"<think>.*", "", text, flags=re.DOTALL).strip()
+
+
+def parse_verdict(text: str, complete: bool = True):
+    """
+    Normalizes an answer to "Yes", "No" or "NA", ignoring reasoning, case and punctuation (e.g. "No." -> "No").
+
+    Args:
+        text (str): The answer text so far.
+        complete (bool): Whether the answer is complete. While streaming, a verdict only counts once the word
+            is followed by another character, so "No" is not mistaken for the start of "Not".
+
+    Returns:
+        The verdict, or None if there is none (yet) (str).
+    """
+    if not complete and "<think>" in re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL):
+        return None  # still reasoning
+    answer = strip_reasoning(text) if complete else re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).lstrip()
+    match = VERDICT_PATTERN.match(answer)
+    if match is None or (not complete and match.end() == len(answer)):
+        return None  # no verdict, or a word that may still continue
+    verdict = match.group(1).lower()
+    return "Yes" if verdict == "yes" else "No" if verdict == "no" else "NA"
+
+
+def get_streamed_answer(client, model: str, messages: list, token_budget=None, time_budget=None, usage=None,
+                        **params) -> str:
+    """
+    Streams a chat completion and returns its normalized Yes/No/NA verdict as soon as it can be parsed.
+
+    Generation is cancelled once a verdict appears outside of any <think> reasoning, or once the token or time budget
+    is used up, in which case the verdict is parsed from what was received so far ("NA" if there is none).
+
+    Args:
+        client (OpenAI): An OpenAI-compatible client.
+        model (str): The model name.
+        messages (list): The chat messages to send.
+        token_budget (int): Maximum number of streamed chunks (about one token each), None for no limit.
+        time_budget (float): Maximum number of seconds per request, None for no limit.
+        usage (dict): If given, filled with the number of streamed chunks received, as completion tokens.
+        **params: Additional decoding parameters passed to the completion call.
+
+    Returns:
+        The verdict (str).
+    """
+    if time_budget is not None:
+        params.setdefault("timeout", time_budget)
+    started = time.monotonic()
+    text = ""
+    tokens = 0
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True, **params)
+    try:
+        for tokens, chunk in enumerate(stream, start=1):
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+                verdict = parse_verdict(text, complete=False)
+                if verdict is not None:
+                    return verdict
+            if token_budget is not None and tokens >= token_budget:
+                break
+            if time_budget is not None and time.monotonic() - started >= time_budget:
+                break
+    finally:
+        stream.close()  # cancels generation on the server if it is still running
+        if usage is not None:
+            usage["completion_tokens"] = tokens
+
+    return parse_verdict(text) or "NA"
+
+
+def get_cached_answer(client, model: str, messages: list, cache=None, **params) -> str:
+    """
+    Same as `get_answer`, but answers found in the cache are returned without a request, and new answers are stored.
+
+    Args:
+        client (OpenAI): An OpenAI-compatible client.
+        model (str): The model name.
+        messages (list): The chat messages to send.
+        cache (ResponseCache): The response cache, None to always send the request.
+        **params: Additional decoding parameters passed to the completion call (e.g. max_tokens).
+
+    Returns:
+        The model's answer (str).
+    """
+    if cache is not None:
+        answer = cache.get(model, messages, **params)
+        if answer is not None:
+            return answer
+
+    answer = get_answer(client, model, messages, **params)
+
+    if cache is not None:
+        cache.put(model, messages, answer, **params)
+    return answer
+
+
+def run_prompts(client, model: str, message_lists: list, concurrency=1, desc=None, cache=None, journal=None, row_ids=None,
+                stream=False, token_budget=None, time_budget=None, retries=2, metrics=None, **params) -> list:
+    """
+    Answers a list of chat message lists with one model, keeping at most `concurrency` requests in flight.
+
+    The answers are returned in the same order as `message_lists`, regardless of the order in which the
+    requests complete. Failed requests, and prompts given as None, are recorded as "Error".
+
+    Args:
+        client (OpenAI): An OpenAI-compatible client.
+        model (str): The model name.
+        message_lists (list): One list of chat messages per prompt.
+        concurrency (int or dict): Parallel request limit, see `resolve_concurrency`.
+        desc (str): Progress bar description.
+        cache (ResponseCache): Cache of previous answers, None to always send the requests.
+        journal (ResultJournal): Journal every answer is appended to as it arrives, answers already in it are skipped.
+        row_ids (list): Identifiers of the prompts used in the journal and in error messages, their positions by default.
+        stream (bool): If True, answers are streamed and normalized to Yes/No/NA, see `get_streamed_answer`.
+        token_budget (int): Streamed chunks allowed per request when streaming, None for no limit.
+        time_budget (float): Seconds allowed per request when streaming, None for no limit.
+        retries (int): Number of times a failed request is retried, with exponential backoff, before it counts as "Error".
+            The clients of `make_client` do not retry on their own, so every retry is counted here.
+        metrics (RequestMetrics): If given, the timing, token counts, retries, answer source and error class of every
+            prompt are recorded in it.
+        **params: Additional decoding parameters passed to the completion call (e.g. max_tokens).
+
+    Returns:
+        The answers, one per prompt (list).
+    """
+    answers = ["Error"] * len(message_lists)
+    row_ids = list(range(len(message_lists))) if row_ids is None else list(row_ids)
+    workers = resolve_concurrency(concurrency, model)
+
+    if stream:
+        # Streamed answers are normalized verdicts, cache them apart from full answers
+        answer_fn = partial(get_streamed_answer, token_budget=token_budget, time_budget=time_budget)
+        cache_params = dict(params, stream=True, token_budget=token_budget, time_budget=time_budget)
+    else:
+        answer_fn = get_answer
+        cache_params = params
+
+    # Answer journaled and cached prompts right away, only the others are queued
+    pending = []
+    for ix, messages in enumerate(message_lists):
+        if messages is None:
+            continue
+        journaled = journal.get(row_ids[ix], model, messages) if journal is not None else None
+        if journaled is not None:
+            answers[ix] = journaled
+            if metrics is not None:
+                metrics.record(model, row_ids[ix], "journal")
+            continue
+        cached = cache.get(model, messages, **cache_params) if cache is not None else None
+        if cached is not None:
+            answers[ix] = cached
+            if metrics is not None:
+                metrics.record(model, row_ids[ix], "cache")
+            if journal is not None:
+                journal.append(row_ids[ix], model, messages, cached)
+        else:
+            pending.append(ix)
+
+    def ask(ix):
+        # One prompt, retried on failure, timed and recorded if metrics are collected
+        usage = {}
+        started = time.time()
+        for attempt in range(retries + 1):
+            try:
+                answer = answer_fn(client, model, message_lists[ix], usage=usage, **params)
+            except Exception as e:
+                if attempt < retries:
+                    time.sleep(min(0.5 * 2 ** attempt, 30))
+                    continue
+                if metrics is not None:
+                    metrics.record(model, row_ids[ix], "request", type(e).__name__, started, time.time() - started,
+                                   attempt, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+                raise
+            if metrics is not None:
+                metrics.record(model, row_ids[ix], "request", "ok", started, time.time() - started, attempt,
+                               usage.get("prompt_tokens"), usage.get("completion_tokens"))
+            return answer
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ask, ix): ix for ix in pending}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc or f"Evaluating prompts for {model}"):
+            ix = futures[future]
+            try:
+                answers[ix] = future.result()
+                if cache is not None:
+                    cache.put(model, message_lists[ix], answers[ix], **cache_params)
+                if journal is not None:
+                    journal.append(row_ids[ix], model, message_lists[ix], answers[ix])
+            except Exception as e:
+                print(f"Error for prompt {row_ids[ix]} with model {model}: {e}")
+
+    return answers
+
+
+def is_yes(answer: str) -> bool:
+    """
+    Returns True if an answer is a "yes" vote, with the same test as desc_valids.py.
+    """
+    return str(answer).strip().lower() == "yes"
+
+
+def run_cascade(client, models: list, message_lists: list, required_yes=None, clean=None, concurrency=1,
+                cache=None, journal=None, row_ids=None, **params) -> dict:
+    """
+    Asks models one after the other, in the given order, and stops asking about a prompt once its vote is decided.
+
+    A prompt is accepted once `required_yes` models said "yes", and rejected once the models left cannot reach
+    `required_yes` anymore. Put the cheapest models first so the expensive ones only see undecided prompts.
+    Models that were not asked about a prompt get the answer "Skipped".
+
+    Args:
+        client (OpenAI): An OpenAI-compatible client.
+        models (list): The model names, in the order they are asked.
+        message_lists (list): One list of chat messages per prompt.
+        required_yes (int): Number of "yes" answers needed to accept a prompt, all models (unanimous) by default.
+        clean (callable): Function (model, answer) -> answer applied before counting votes, e.g. to strip reasoning.
+        concurrency, cache, journal, row_ids, **params: As in `run_prompts`.
+
+    Returns:
+        The answers of each model, one per prompt (dict of model -> list).
+    """
+    required_yes = len(models) if required_yes is None else required_yes
+    row_ids = list(range(len(message_lists))) if row_ids is None else list(row_ids)
+    yes_votes = [0] * len(message_lists)
+    undecided = [ix for ix, messages in enumerate(message_lists) if messages is not None]
+    results = {}
+
+    for position, model in enumerate(models):
+        remaining = len(models) - position - 1
+        answers = ["Skipped"] * len(message_lists)
+        for ix, messages in enumerate(message_lists):
+            if messages is None:
+                answers[ix] = "Error"
+
+        asked = run_prompts(client, model, [message_lists[ix] for ix in undecided], concurrency=concurrency,
+                            cache=cache, journal=journal, row_ids=[row_ids[ix] for ix in undecided], **params)
+
+        still_undecided = []
+        for ix, answer in zip(undecided, asked):
+            answers[ix] = clean(model, answer) if clean is not None else answer
+            yes_votes[ix] += is_yes(answers[ix])
+            accepted = yes_votes[ix] >= required_yes
+            rejected = yes_votes[ix] + remaining < required_yes
+            if not (accepted or rejected):
+                still_undecided.append(ix)
+
+        print(f"{model}: asked {len(undecided)}, {len(still_undecided)} still undecided")
+        undecided = still_undecided
+        results[model] = answers
+
+    return results
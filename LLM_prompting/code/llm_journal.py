@@ -0,0 +1,72 @@
+from pathlib import Path
+import hashlib
+import json
+import threading
+
+
+class ResultJournal:
+    """
+    Append-only JSONL journal of LLM answers, flushed as each answer arrives.
+
+    Every line records the prompt row, the model, a hash of the messages and the answer, so an interrupted
+    sweep can be resumed by skipping the (row, model) pairs that were already answered for the same messages.
+
+    Args:
+        path (str or Path): Path to the journal file.
+        resume (bool): If True, previously journaled answers are loaded and kept, otherwise the journal is started anew.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._answers = {}
+
+        if resume and self.path.exists():
+            with open(self.path, "rb+") as f:
+                data = f.read()
+                # A crash may cut off the last line: drop it so new records do not get glued onto it
+                complete = data[:data.rfind(b"\n") + 1]
+                if len(complete) < len(data):
+                    f.truncate(len(complete))
+            for line in complete.decode("utf-8").splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._answers[(record["row"], record["model"])] = (record["key"], record["answer"])
+
+        self._file = open(self.path, "a" if resume else "w")
+
+    @staticmethod
+    def make_key(messages: list) -> str:
+        """
+        Returns the hash of a prompt's messages.
+        """
+        return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, row: int, model: str, messages: list):
+        """
+        Returns the journaled answer of a prompt row and model, or None if it was not answered with these messages.
+        """
+        entry = self._answers.get((row, model))
+        if entry is None or entry[0] != self.make_key(messages):
+            return None
+        return entry[1]
+
+    def append(self, row: int, model: str, messages: list, answer: str):
+        """
+        Writes an answer to the journal and flushes it to disk.
+        """
+        key = self.make_key(messages)
+        record = json.dumps({"row": row, "model": model, "key": key, "answer": answer})
+        with self._lock:
+            self._answers[(row, model)] = (key, answer)
+            self._file.write(record + "\n")
+            self._file.flush()
+
+    def __len__(self):
+        return len(self._answers)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,100 @@
+from pathlib import Path
+import json
+import threading
+import time
+import pandas as pd
+
+METRICS_NAME = "llm_metrics"
+METRICS_FIELDS = ["model", "row", "source", "status", "started", "latency", "retries", "prompt_tokens",
+                  "completion_tokens"]
+
+
+class RequestMetrics:
+    """
+    Thread-safe per-request instrumentation of LLM prompting.
+
+    Every prompt answered by `run_prompts` adds one record: where its answer came from ("request", "cache" or
+    "journal"), its status ("ok" or the class of the error that made it fail), its latency including retries, the number
+    of retries and its prompt and completion token counts (when the server reports them; streamed requests count
+    received chunks as completion tokens).
+
+    Args:
+        path (str or Path): Path the records are written to by `write`, as "<path>.csv" and a "<path>.json" summary.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        self.records = []
+
+    def record(self, model: str, row, source: str, status: str = "ok", started=None, latency: float = 0.0,
+               retries: int = 0, prompt_tokens=None, completion_tokens=None):
+        """
+        Adds the record of one answered prompt.
+        """
+        record = {"model": model, "row": row, "source": source, "status": status,
+                  "started": time.time() if started is None else started, "latency": latency, "retries": retries,
+                  "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        with self._lock:
+            self.records.append(record)
+
+    def to_frame(self) -> pd.DataFrame:
+        with self._lock:
+            return pd.DataFrame(self.records, columns=METRICS_FIELDS)
+
+    def summary(self) -> dict:
+        """
+        Aggregates the records per model: request, cache and journal counts, error classes, latency percentiles,
+        token totals, retries and throughput (answered prompts per second of wall time).
+        """
+        df = self.to_frame()
+        summary = {}
+        for model, group in df.groupby("model", sort=False):
+            requests = group[group["source"] == "request"]
+            latency = requests["latency"]
+            wall = (group["started"] + group["latency"]).max() - group["started"].min()
+            summary[model] = {
+                "prompts": int(len(group)),
+                "requests": int(len(requests)),
+                "cache_hits": int((group["source"] == "cache").sum()),
+                "journal_hits": int((group["source"] == "journal").sum()),
+                "errors": int((group["status"] != "ok").sum()),
+                "error_classes": group.loc[group["status"] != "ok", "status"].value_counts().to_dict(),
+                "retries": int(group["retries"].sum()),
+                "latency_mean": float(latency.mean()) if len(latency) else None,
+                "latency_p50": float(latency.quantile(0.5)) if len(latency) else None,
+                "latency_p95": float(latency.quantile(0.95)) if len(latency) else None,
+                "prompt_tokens": int(pd.to_numeric(requests["prompt_tokens"]).sum()),
+                "completion_tokens": int(pd.to_numeric(requests["completion_tokens"]).sum()),
+                "wall_time": float(wall),
+                "throughput": float(len(group) / wall) if wall > 0 else None,
+            }
+        return summary
+
+    def write(self, path=None):
+        """
+        Writes the records to "<path>.csv" and their summary to "<path>.json".
+        """
+        path = Path(path) if path is not None else self.path
+        if path.suffix in (".csv", ".json"):
+            path = path.with_suffix("")
+        csv_path, json_path = path.parent / f"{path.name}.csv", path.parent / f"{path.name}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.to_frame().to_csv(csv_path, index=False)
+        with open(json_path, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+        print(f"Request metrics saved to {csv_path} and {json_path}")
+
+
+def open_metrics(metrics, output_path, name: str = METRICS_NAME):
+    """
+    Returns a RequestMetrics for `metrics`: True for `name` in `output_path`, a path, an existing
+    RequestMetrics, or None (no instrumentation).
+    """
+    if metrics is None or metrics is False:
+        return None
+    if metrics is True:
+        return RequestMetrics(Path(output_path) / name)
+    if isinstance(metrics, RequestMetrics):
+        return metrics
+    return RequestMetrics(metrics)
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+import urllib.request
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from openai import OpenAI
+
+
+class EndpointRouter:
+    """
+    Routes chat completion requests across several OpenAI-compatible Ollama hosts, with the same
+    `chat.completions.create` interface as an OpenAI client so it can be passed wherever a client is expected.
+
+    A model is pinned to the hosts that already have it loaded (as reported by Ollama's /api/ps, or because they
+    served it before), and requests go to the pinned host with the fewest requests in flight. A model that is loaded
+    nowhere is placed on the least busy host and stays there, instead of being round-robined onto cold hosts.
+    A host whose request fails is backed off exponentially and the request fails over to the next host.
+
+    Args:
+        endpoints (list): Base URLs of the hosts, e.g. "http://gpu1:11434/v1/".
+        api_key (str): API key sent to every host.
+        affinity (dict): Optional {model: [base URLs]} pins, added to the discovered ones.
+        spill_queue_depth (int): If set, a model may also be placed on a new host once all its hosts have this many
+            requests in flight. None (default) never spreads a model to a cold host while a warm one is reachable.
+        backoff (float): Seconds a host is skipped after its first failure, doubled for each further failure.
+        max_backoff (float): Upper bound of the backoff.
+        discover (bool): Whether to ask each host which models it has loaded.
+        max_retries (int): Retries of the OpenAI client of each host. 0 (default) leaves retrying to fail-over and to
+            `run_prompts(retries=...)`, so every failure is counted and a dead host is left at once.
+    """
+
+    def __init__(self, endpoints: list, api_key: str = "ollama", affinity=None, spill_queue_depth=None,
+                 backoff: float = 2.0, max_backoff: float = 120.0, discover: bool = True, max_retries: int = 0):
+        if not endpoints:
+            raise ValueError("EndpointRouter needs at least one endpoint.")
+        self.clients = {url: OpenAI(base_url=url, api_key=api_key, max_retries=max_retries) for url in endpoints}
+        self.endpoints = list(self.clients)
+        self.spill_queue_depth = spill_queue_depth
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._in_flight = {url: 0 for url in self.endpoints}
+        self._failures = {url: 0 for url in self.endpoints}
+        self._retry_at = {url: 0.0 for url in self.endpoints}
+        self._hosts = {}  # model -> hosts it is pinned to
+        for model, urls in (affinity or {}).items():
+            self._hosts[model] = [url for url in urls if url in self.clients]
+        if discover:
+            self.refresh_loaded()
+
+        # Same call shape as OpenAI().chat.completions.create
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def refresh_loaded(self):
+        """
+        Pins each model to the hosts that currently have it loaded, according to Ollama's /api/ps.
+        """
+        for url in self.endpoints:
+            parts = urlsplit(url)
+            try:
+                with urllib.request.urlopen(f"{parts.scheme}://{parts.netloc}/api/ps", timeout=5) as response:
+                    loaded = [entry["name"] for entry in json.load(response).get("models", [])]
+            except Exception:
+                continue  # not an Ollama host, or unreachable: no affinity information
+            with self._lock:
+                for model in loaded:
+                    hosts = self._hosts.setdefault(model, [])
+                    if url not in hosts:
+                        hosts.append(url)
+
+    def _available(self, urls):
+        now = time.monotonic()
+        return [url for url in urls if self._retry_at[url] <= now]
+
+    def _candidates(self, model: str) -> list:
+        """
+        Returns the hosts to try for a model, best first, pinning the model to a new host if needed.
+        """
+        with self._lock:
+            pinned = self._hosts.setdefault(model, [])
+            warm = sorted(self._available(pinned), key=lambda url: self._in_flight[url])
+            busy = self.spill_queue_depth is not None and warm and self._in_flight[warm[0]] >= self.spill_queue_depth
+            if not warm or busy:
+                cold = [url for url in self._available(self.endpoints) if url not in pinned]
+                if cold:
+                    # Least busy host, preferring hosts with fewer models pinned to them
+                    host = min(cold, key=lambda url: (self._in_flight[url],
+                                                      sum(url in hosts for hosts in self._hosts.values())))
+                    pinned.append(host)
+                    warm = [host] + warm
+            if not warm:
+                # Every host is backed off: try them anyway, soonest retry first
+                warm = sorted(self.endpoints, key=lambda url: self._retry_at[url])
+            # Remaining hosts are only used for fail-over, least busy first
+            others = sorted((url for url in self._available(self.endpoints) if url not in warm), key=lambda url: self._in_flight[url])
+            return warm + others
+
+    def _acquire(self, url):
+        with self._lock:
+            self._in_flight[url] += 1
+
+    def _release(self, url, failed=False):
+        with self._lock:
+            self._in_flight[url] -= 1
+            if failed:
+                self._failures[url] += 1
+                delay = min(self.backoff * 2 ** (self._failures[url] - 1), self.max_backoff)
+                self._retry_at[url] = time.monotonic() + delay
+            else:
+                self._failures[url] = 0
+                self._retry_at[url] = 0.0
+
+    def create(self, model: str, messages: list, **params):
+        """
+        Sends a chat completion request to the best host for the model, failing over to the others on errors.
+        """
+        last_error = None
+        for url in self._candidates(model):
+            self._acquire(url)
+            try:
+                response = self.clients[url].chat.completions.create(model=model, messages=messages, **params)
+            except Exception as e:
+                self._release(url, failed=True)
+                last_error = e
+                continue
+            if params.get("stream"):
+                return _TrackedStream(response, lambda url=url: self._release(url))
+            self._release(url)
+            with self._lock:
+                if url not in self._hosts[model]:
+                    self._hosts[model].append(url)  # the model is now loaded there
+            return response
+        raise last_error
+
+    def queue_depths(self) -> dict:
+        """
+        Returns the number of requests in flight per host.
+        """
+        with self._lock:
+            return dict(self._in_flight)
+
+
+class _TrackedStream:
+    # Keeps a host's request counted as in flight until its stream is consumed or closed
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+            self._stream.close()
+
+
+def make_client(endpoints=None, base_url: str = "http://ollama:11434/v1/", api_key: str = "ollama", max_retries: int = 0,
+                **router_options):
+    """
+    Returns an EndpointRouter over `endpoints` if several hosts are given, otherwise a single OpenAI client.
+
+    The clients are built with `max_retries=0` by default, so that failed requests are retried (and counted in the
+    request metrics) by `run_prompts(retries=...)` instead of silently inside the OpenAI client.
+    """
+    if endpoints and len(endpoints) > 1:
+        return EndpointRouter(endpoints, api_key=api_key, max_retries=max_retries, **router_options)
+    return OpenAI(base_url=endpoints[0] if endpoints else base_url, api_key=api_key, max_retries=max_retries)
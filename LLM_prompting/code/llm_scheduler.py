@@ -0,0 +1,141 @@
+from pathlib import Path
+import pandas as pd
+import torch
+from huggingface_hub import login
+from auto_LLMs import format_messages, get_model_answers
+from llm_cache import open_cache
+from llm_journal import ResultJournal
+from llm_router import make_client
+from build_manifest import content_hash, open_manifest
+from llm_metrics import open_metrics
+
+
+def schedule_LLMs(rule_paths: list, models: list, output_path: str, concurrency=1, cache=None, resume=False,
+                  stream=False, token_budget=None, time_budget=None, backend="ollama", hf_token=None, batch_size=8,
+                  candidate_batch_size=1, endpoints=None, manifest=None, retries=2, metrics=None):
+    """
+    Answers the prompts of several rule files model by model: every (rule file, prompt) work item is gathered up front,
+    so each model is loaded once and answers all prompts of all rules before the next model runs. The answers are
+    then fanned back out to the same per-rule outputs as auto_LLMs.
+
+    Args:
+        Paths to the files containing rule prompts (rule_paths: list) ,
+        A list of LLM models (models: list) ,
+        Path to the folder where the results will be outputted (output_path: str) ,
+        Manifest of the answers' input hashes, True for "manifest.json" in the output folder, a path or a BuildManifest;
+        if given, only the (prompt, model) pairs whose messages, model or decoding options changed are asked again and the
+        other answers are reused from the previous "{stem}_final.csv", disabled by default (manifest: bool, str or BuildManifest) ,
+        The remaining options as in auto_LLMs .
+
+    Returns:
+        None .
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    cache = open_cache(cache, output_path)
+    manifest = open_manifest(manifest, output_path)
+    metrics = open_metrics(metrics, output_path)
+
+    # One journal for the whole schedule, keyed by rule file and prompt row
+    journal = ResultJournal(output_path / "schedule_journal.jsonl", resume=resume)
+    client = make_client(
+    endpoints=endpoints,
+    base_url="http://ollama:11434/v1/",
+    api_key="ollama"
+)
+
+    torch.manual_seed(0)
+    if hf_token and backend == "local":  # only the local backend downloads models from HuggingFace
+        login(token=hf_token)
+
+    # Gather all work items up front, remembering which slice belongs to which rule file
+    rules, slices = {}, {}
+    contexts, questions, message_lists, row_ids = [], [], [], []
+    for rule_path in map(Path, rule_paths):
+        rule = pd.read_csv(rule_path)
+        rule_contexts, rule_questions, rule_messages = format_messages(rule)
+        slices[rule_path.stem] = slice(len(message_lists), len(message_lists) + len(rule_messages))
+        rules[rule_path.stem] = rule
+        contexts.extend(rule_contexts)
+        questions.extend(rule_questions)
+        message_lists.extend(rule_messages)
+        row_ids.extend(f"{rule_path.stem}:{ix}" for ix in range(len(rule_messages)))
+    print(f"Scheduled {len(message_lists)} prompts from {len(rules)} rule files for {len(models)} models")
+
+    if stream:
+        # Cut generation once a verdict is parsed instead of truncating every answer
+        decoding = {"stream": True, "token_budget": token_budget, "time_budget": time_budget}
+    else:
+        decoding = {"max_tokens": 5}  # Limit tokens to get concise Yes/No output
+
+    # Answers of the previous run, reused for the prompts whose inputs did not change
+    previous = {}
+    if manifest is not None:
+        for stem in rules:
+            final_path = output_path / f"{stem}_final.csv"
+            if final_path.exists():
+                previous[stem] = pd.read_csv(final_path, dtype=str, keep_default_na=False)
+    options = {"backend": backend, "candidate_batch_size": candidate_batch_size, **decoding}
+
+    for model in models:
+        print(f"Processing model: {model}")
+
+        answers = ["Error"] * len(message_lists)
+        confidences = [None] * len(message_lists)
+        todo = list(range(len(message_lists)))
+        if manifest is not None:
+            todo = []
+            for stem, rows in slices.items():
+                hashes = [content_hash(model, options, messages) for messages in message_lists[rows]]
+                old_hashes = manifest.get("answers", f"{stem}|{model}") or []
+                old = previous.get(stem)
+                if old is None or model not in old.columns or len(old) != len(old_hashes):
+                    old_hashes = []  # nothing to reuse
+                old_rows = {input_hash: ix for ix, input_hash in enumerate(old_hashes)}
+                reused = 0
+                for ix, input_hash in zip(range(rows.start, rows.stop), hashes):
+                    # Failed requests are asked again
+                    if input_hash in old_rows and old[model].iloc[old_rows[input_hash]] != "Error":
+                        answers[ix] = old[model].iloc[old_rows[input_hash]]
+                        if f"{model}_confidence" in old.columns:
+                            confidences[ix] = float(old[f"{model}_confidence"].iloc[old_rows[input_hash]] or "nan")
+                        reused += 1
+                    else:
+                        todo.append(ix)
+                manifest.update("answers", f"{stem}|{model}", hashes, rebuilt=len(hashes) - reused, reused=reused)
+            print(f"Reusing {len(message_lists) - len(todo)} unchanged answers, asking {len(todo)}")
+
+        if todo:
+            # Only the model's changed prompts are asked, so an unchanged model is not loaded at all
+            todo_answers, todo_confidences = get_model_answers(
+                client, model, [contexts[ix] for ix in todo], [questions[ix] for ix in todo],
+                [message_lists[ix] for ix in todo], backend=backend, hf_token=hf_token, batch_size=batch_size,
+                candidate_batch_size=candidate_batch_size, concurrency=concurrency, cache=cache, journal=journal,
+                row_ids=[row_ids[ix] for ix in todo], retries=retries, metrics=metrics, **decoding)
+            for position, ix in enumerate(todo):
+                answers[ix] = todo_answers[position]
+                if todo_confidences is not None:
+                    confidences[ix] = todo_confidences[position]
+        if backend != "local":
+            confidences = None
+
+        # Fan the answers back out to each rule and save its intermediate results
+        for stem, rule in rules.items():
+            if confidences is not None:
+                rule[f"{model}_confidence"] = confidences[slices[stem]]
+            rule[model] = answers[slices[stem]]
+            rule.to_csv(output_path / f"{stem}_{model}.csv", index=False)
+        print(f"Results saved for model {model} for {len(rules)} rules")
+
+    for stem, rule in rules.items():
+        # Remove the "Prompt" column as it is no longer needed and save the final results
+        rule.drop(columns=["Prompt"]).to_csv(output_path / f"{stem}_final.csv", index=False)
+    print(f"Final results saved to {output_path}")
+    journal.close()
+    if manifest is not None:
+        manifest.save()
+        print(f"Manifest: {manifest.summary()}")
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+    if metrics is not None:
+        metrics.write()
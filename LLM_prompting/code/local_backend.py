@@ -0,0 +1,109 @@
+import math
+import torch
+from tqdm import tqdm
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+
+class LocalYesNoScorer:
+    """
+    In-process backend answering Yes/No questions with a single forward pass per batch of prompts.
+
+    Instead of generating text, the next-token logits of the "Yes" and "No" tokens are compared, which gives
+    both the label and a probability for it.
+
+    Args:
+        model_name (str): HuggingFace model name or path.
+        device (str): Torch device, "cpu" by default.
+        batch_size (int): Number of prompts per forward pass.
+        temperature (float): Temperature applied to the Yes/No logit difference, see `fit_temperature`.
+        hf_token (str): HuggingFace token for gated models.
+    """
+
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 8, temperature: float = 1.0, hf_token=None):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.temperature = temperature
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, token=hf_token)
+        self.tokenizer.padding_side = "left"  # so the last position is the next token for every prompt
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_name, token=hf_token).to(device).eval()
+
+        yes_ids = self._answer_token_ids(["Yes", " Yes", "yes", " yes"])
+        no_ids = self._answer_token_ids(["No", " No", "no", " no"])
+        # A token shared by both answers (e.g. a bare space piece) says nothing about the answer
+        self.yes_ids = sorted(yes_ids - no_ids)
+        self.no_ids = sorted(no_ids - yes_ids)
+        if not self.yes_ids or not self.no_ids:
+            raise ValueError(f"Could not find distinct Yes and No tokens for {model_name}.")
+
+    def _answer_token_ids(self, variants: list) -> set:
+        # First token of each spelling that carries part of the word, the answer may start with or without a space.
+        # SentencePiece tokenizers may encode the leading space as a bare "▁" piece, which is skipped.
+        ids = set()
+        for variant in variants:
+            for token_id in self.tokenizer.encode(variant, add_special_tokens=False):
+                if self.tokenizer.decode([token_id]).strip():
+                    ids.add(token_id)
+                    break
+        return ids
+
+    def _render(self, messages: list) -> str:
+        if getattr(self.tokenizer, "chat_template", None):
+            return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return "\n".join(message["content"] for message in messages) + "\nAnswer:"
+
+    @torch.no_grad()
+    def logit_differences(self, message_lists: list) -> list:
+        """
+        Returns log P(Yes) - log P(No) of the next token for each prompt, in input order.
+        """
+        texts = [self._render(messages) for messages in message_lists]
+        # Batch prompts of similar length together to limit padding
+        order = sorted(range(len(texts)), key=lambda ix: len(texts[ix]))
+        differences = [0.0] * len(texts)
+
+        for start in tqdm(range(0, len(order), self.batch_size), desc=f"Scoring prompts with {self.model_name}"):
+            batch = order[start:start + self.batch_size]
+            inputs = self.tokenizer([texts[ix] for ix in batch], return_tensors="pt", padding=True).to(self.device)
+            # Positions count from each prompt's first real token, so left padding does not shift absolute positions
+            position_ids = (inputs["attention_mask"].long().cumsum(-1) - 1).clamp(min=0)
+            logits = self.model(**inputs, position_ids=position_ids).logits[:, -1, :].float()
+            log_probs = torch.log_softmax(logits, dim=-1)
+            yes = torch.logsumexp(log_probs[:, self.yes_ids], dim=-1)
+            no = torch.logsumexp(log_probs[:, self.no_ids], dim=-1)
+            for ix, difference in zip(batch, (yes - no).tolist()):
+                differences[ix] = difference
+
+        return differences
+
+    def score(self, message_lists: list) -> list:
+        """
+        Answers each prompt with a ("Yes" or "No", probability of that label) tuple, in input order.
+        """
+        results = []
+        for difference in self.logit_differences(message_lists):
+            p_yes = 1 / (1 + math.exp(-difference / self.temperature))
+            results.append(("Yes", p_yes) if p_yes >= 0.5 else ("No", 1 - p_yes))
+        return results
+
+    def fit_temperature(self, message_lists: list, labels: list) -> float:
+        """
+        Calibrates the probabilities on labelled prompts ("Yes"/"No") by picking the temperature with the lowest
+        negative log-likelihood, and returns it.
+        """
+        differences = self.logit_differences(message_lists)
+        targets = [str(label).strip().lower() == "yes" for label in labels]
+
+        def nll(temperature):
+            total = 0.0
+            for difference, target in zip(differences, targets):
+                z = difference / temperature
+                # -log sigmoid(z) for Yes, -log sigmoid(-z) for No, computed stably
+                total += math.log1p(math.exp(-abs(z))) + max(-z if target else z, 0)
+            return total
+
+        self.temperature = min((0.25 * step for step in range(1, 41)), key=nll)
+        return self.temperature
@@ -1,9 +1,10 @@
 from pathlib import Path
 import pandas as pd
 from tqdm import tqdm
+from build_manifest import content_hash
 
 
-def prompt_generator(prompt_path: str, data_path: str, output_path: str):
+def prompt_generator(prompt_path: str, data_path: str, output_path: str, manifest=None):
     """
     Generates and writes all LLM prompts for each output label.
     
@@ -11,6 +12,8 @@ def prompt_generator(prompt_path: str, data_path: str, output_path: str):
         prompt_path (str): Path to the file containing a generic LLM prompt.
         data_path (str): Path to the file containing labels and their outputs to be substituted.
         output_path (str): Path to the folder where the prompt tables should be written.
+        manifest (BuildManifest): If given, only prompt tables whose template or data section changed are rewritten,
+            and tables of rules no longer in the data are removed.
     """
     # Read prompt
     prompt_path = Path(prompt_path)
@@ -33,7 +36,7 @@ def prompt_generator(prompt_path: str, data_path: str, output_path: str):
     for ix, line in tqdm(enumerate(lines), total=len(lines)):
         if line.startswith("Rule_constant:"):  # Start of a new rule
             if section_active:  # Process the previous section before starting a new one
-                process_section(rule_no, constant, section, prompt, output_path)
+                process_section(rule_no, constant, section, prompt, output_path, manifest)
                 rule_no += 1
             # Initialize a new rule
             constant = line.split(" ", 1)[-1].strip().replace(" ", "_")  # Extract constant
@@ -42,7 +45,7 @@ def prompt_generator(prompt_path: str, data_path: str, output_path: str):
 
         elif line.strip() == "":  # End of a section
             if section_active:  # Only process if a section is active
-                process_section(rule_no, constant, section, prompt, output_path)
+                process_section(rule_no, constant, section, prompt, output_path, manifest)
                 rule_no += 1
                 section_active = False
 
@@ -51,10 +54,17 @@ def prompt_generator(prompt_path: str, data_path: str, output_path: str):
     
     # Process the final section if the file ends without an empty line
     if section_active:
-        process_section(rule_no, constant, section, prompt, output_path)
+        process_section(rule_no, constant, section, prompt, output_path, manifest)
 
+    if manifest is not None:
+        # Remove the prompt tables of rules that are no longer in the data
+        written = manifest.last_run.get("prompts", {})
+        for stale in [constant for constant in manifest.keys("prompts") if constant not in written]:
+            (output_path / f"{stale}.csv").unlink(missing_ok=True)
+            manifest.forget("prompts", stale)
 
-def process_section(rule_no, constant, section, prompt, output_path):
+
+def process_section(rule_no, constant, section, prompt, output_path, manifest=None):
     """
     Processes a section of the input data and writes the generated prompts to a CSV.
     
@@ -64,10 +74,18 @@ def process_section(rule_no, constant, section, prompt, output_path):
         section (list): Lines related to the current rule.
         prompt (str): The template for generating prompts.
         output_path (Path): The directory to save the generated CSV.
+        manifest (BuildManifest): If given, the CSV is only rewritten if its inputs changed since it was last written.
     
     Returns:
         None
     """
+    if manifest is not None:
+        input_hash = content_hash(prompt, rule_no, constant, section)
+        if manifest.get("prompts", constant) == input_hash and (output_path / f"{constant}.csv").exists():
+            manifest.update("prompts", constant, input_hash, rebuilt=0, reused=1)
+            return
+        manifest.update("prompts", constant, input_hash)
+
     candidates = []
     prompts = []
     
@@ -89,10 +107,11 @@ def process_section(rule_no, constant, section, prompt, output_path):
     }
     pd.DataFrame(df_data).to_csv(output_path / f"{constant}.csv", index=False)
 
-# Example Usage
+# Example (not run when imported)
 
-prompt_path = "/app/LLM_prompting/data/prompt/Zero-shot_prompt.txt"
-data_path = "/app/LLM_prompting/data/output.txt"
-output_path = "/app/LLM_prompting/data"
-prompt_generator(prompt_path=prompt_path, data_path=data_path, output_path=output_path)
+if __name__ == "__main__":
+    prompt_path = "/app/LLM_prompting/data/prompt/Zero-shot_prompt.txt"
+    data_path = "/app/LLM_prompting/data/output.txt"
+    output_path = "/app/LLM_prompting/data"
+    prompt_generator(prompt_path=prompt_path, data_path=data_path, output_path=output_path)
 
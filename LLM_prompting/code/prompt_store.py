@@ -0,0 +1,51 @@
+from pathlib import Path
+import json
+
+PROMPT_STORE_NAME = "prompts.jsonl"
+PROMPT_STORE_FIELDS = ["rule_id", "head", "body", "code", "code_desc", "prompt"]
+
+
+def write_prompt_store(records, path) -> int:
+    """
+    Writes rendered prompts to a single JSONL prompt store in one streaming pass.
+
+    Args:
+        Records holding the PROMPT_STORE_FIELDS of each Horn rule, in rule order (records: iterable of dict) ,
+        Path to the prompt store file (path: str or pathlib Path object) .
+
+    Returns:
+        The number of prompts written (count: int) .
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    count = 0
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps({field: record[field] for field in PROMPT_STORE_FIELDS}) + "\n")
+            count += 1
+    return count
+
+
+def iter_prompt_store(path, chunksize: int = 1000):
+    """
+    Lazily reads a prompt store in chunks, keeping rule order.
+
+    Args:
+        Path to the prompt store file (path: str or pathlib Path object) ,
+        Number of prompts per chunk (chunksize: int) .
+
+    Yields:
+        Lists of at most `chunksize` prompt records (chunk: list of dict) .
+    """
+    chunk = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
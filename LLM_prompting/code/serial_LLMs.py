@@ -1,9 +1,35 @@
 from pathlib import Path
+import importlib.util
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import re
 from openai import OpenAI
-import os
+from llm_router import make_client
+from llm_engine import run_prompts, get_cached_answer
+from llm_cache import open_cache
+from llm_journal import ResultJournal
+from llm_metrics import open_metrics
+from prompt_store import PROMPT_STORE_NAME, write_prompt_store, iter_prompt_store
+from code_descriptions import NO_DESCRIPTION, load_cpt_index, load_icd9_index, lookup_cpt, describe_codes
+
+def load_horn_rules(rules_dir):
+    """
+    Loads the Horn rule parser shared with the rule filtering scripts (horn_rules.py) from their folder.
+
+    Args:
+        Folder containing horn_rules.py, e.g. "Rule filtering & LLM prep" (rules_dir: str) .
+
+    Returns:
+        The horn_rules module (module) .
+    """
+    module_path = Path(rules_dir) / "horn_rules.py"
+    if not module_path.exists():
+        raise FileNotFoundError(f"No horn_rules.py in {rules_dir}, pass the rule filtering folder as rules_dir.")
+    spec = importlib.util.spec_from_file_location("horn_rules", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
 def cpt_to_desc(code: str, desc: Path) -> str:
     """
@@ -17,159 +43,175 @@ def cpt_to_desc(code: str, desc: Path) -> str:
         The CPT code's description (code_desc: str) .
     """
     
-    desc = pd.read_csv(desc) # read description table
-    code_desc = "No description available" # default case where code is not defined in the table
-    
-    for _, row in desc.iterrows():
-        desc_range = range(int(row["MINCODEINSUBSECTION"]), int(row["MAXCODEINSUBSECTION"])) # get section range per row
-        
-        if int(code) in desc_range: # determine if the input falls in the range
-            code_desc = row["SUBSECTIONHEADER"]
-            break
+    return lookup_cpt(code, load_cpt_index(Path(desc))) # bisect the subsection ranges, loaded once per table
             
-    return code_desc
-
 def icd9_to_desc(code: str, desc: Path) -> str:
     """
     Converts an ICD-9 diagnosis code to its description.
 
     """
     
-    desc = pd.read_csv(desc) # read description table
-    code_desc = "No description available" # default case where code is not defined in the table
-    
-    for _, row in desc.iterrows():
-        desc_code = str(row["ICD9_CODE"]) # get row's code
-        
-        if str(code) == desc_code: # determine if the codes match
-            code_desc = row["LONG_TITLE"]
-            break
-            
-    return code_desc
+    return load_icd9_index(Path(desc)).get(str(code), NO_DESCRIPTION) # hash lookup, loaded once per table
 
 def prompt_generator(prompt_path: str,
                      data_path: str,
                      diagnosis_descriptions_path: str,
                      procedure_descriptions_path: str,
-                     output_path: str):
+                     output_path: str,
+                     rules_dir: str):
     """
-    Generates and writes all LLM prompts for each output label.
+    Generates all LLM prompts for each output label and writes them, in rule order, to a single prompt store
+    (prompts.jsonl) in the output folder. Rules are parsed with horn_rules.py from `rules_dir`.
 
     """
+    horn_rules = load_horn_rules(rules_dir)
     
     # Read prompt
     prompt_path = Path(prompt_path)
     prompt = prompt_path.read_text()
     
-    # Read data
+    # Parse all rules once into interned atoms
     data_path = Path(data_path)
-    data = pd.read_csv(data_path, sep=" <= ", header=None, engine="python")
+    rules = horn_rules.read_rules(data_path)
     
     d_icd = Path(diagnosis_descriptions_path)
     d_cpt = Path(procedure_descriptions_path)
     
     output_path = Path(output_path)
 
-    for ix, row in tqdm(data.iterrows()):
-        head, body = row.iloc[0], row.iloc[1]
-        head = head.replace("https://biomedit.ch/rdf/sphn-ontology/sphn#", "SPHN:")
-        head = head.replace("https://biomedit.ch/rdf/sphn-ontology/AIDAVA/", "aidava-resource:")
-        
-        body = body.replace("https://biomedit.ch/rdf/sphn-ontology/AIDAVA/", "aidava-resource:")
-        body = body.replace("https://biomedit.ch/rdf/sphn-resource/icd-9-gm/2023/3/", "ICD9:")
-        body = body.replace("https://www.aapc.com/codes/cpt-codes/", "CPT:")
-        
-        # Filter out Outliers
-        age_group = head.split("AgeGroup/")[-1][:-1]
-        if age_group == "Outlier":
-            continue
-        
-        code_desc = "No matching description"
-        if "ICD9:" in body:
-            code = re.search(r"ICD9:([^,]+),X\)", body).group(1).strip()
-            code_desc = icd9_to_desc(code, d_icd)
-            code = f"ICD9:{code}"
-        elif "CPT:" in body:
-            code = re.search(r"CPT:([^,]+),X\)", body).group(1).strip()
-            code_desc = cpt_to_desc(code, d_cpt)
-            code = f"CPT:{code}"
-        else:
-            code = ":"
-        
-        new_prompt = prompt.format(body=body,
-                                   head=head,
-                                   code=code,
-                                   code_desc=code_desc)
-        
-        with open(output_path / f"horn_rule_{ix}.txt", "w") as f:
-            f.write(new_prompt)
+    # Compact IRIs to SPHN, aidava-resource, ICD9 and CPT CURIEs, once per distinct term
+    trie = horn_rules.PrefixTrie()
+    heads, bodies = rules.render(trie)
+    prefixes, local_names = rules.split_terms(trie)
+    
+    # Filter out Outliers
+    head_atoms = rules.heads()
+    outliers = [ix for ix, term in enumerate(rules.terms) if term.split("AgeGroup/")[-1] == "Outlier"]
+    keep = ~np.isin(head_atoms.loc[heads.index, "object"].to_numpy(), outliers)
+    heads, bodies = heads[keep], bodies[keep]
+    
+    # Every rule's code is the subject of its first body atom ending in X, resolve all descriptions in one call
+    body_atoms = rules.bodies()
+    body_atoms = body_atoms[body_atoms["object"].to_numpy() == rules.term_id("X")]
+    codes = pd.Series(":", index=bodies.index, dtype=object)
+    for vocabulary in ["CPT", "ICD9"]:  # ICD-9 codes take precedence
+        coded = body_atoms[prefixes[body_atoms["subject"].to_numpy()] == vocabulary].groupby("rule")["subject"].first()
+        coded = coded[coded.index.isin(codes.index)]
+        codes[coded.index] = vocabulary + ":" + pd.Series(local_names[coded.to_numpy()], index=coded.index).str.strip()
+    code_descs = describe_codes(codes, d_icd, d_cpt)
+    code_descs[codes == ":"] = "No matching description"
+
+    def records():
+        for ix in tqdm(heads.index):
+            head, body, code, code_desc = heads[ix], bodies[ix], codes[ix], code_descs[ix]
+            
+            new_prompt = prompt.format(body=body,
+                                       head=head,
+                                       code=code,
+                                       code_desc=code_desc)
+            
+            yield {"rule_id": int(ix), "head": head, "body": body, "code": code, "code_desc": code_desc, "prompt": new_prompt}
+    
+    write_prompt_store(records(), output_path / PROMPT_STORE_NAME)
             
-def get_LLM_answer(question: str, model: str) -> str:
+def get_LLM_messages(question: str) -> list:
     """
-    Given a question, get an answer from the specified LLM model.
+    Formats a question as chat messages for the LLM.
 
     """
-    
-    # Define LLM client
-    client = OpenAI(
+
+    return [
+        {"role": "system", "content": f"Answer only in 'Yes', 'No', or 'NA'."},
+        {"role": "user", "content": question}
+    ]
+
+def get_LLM_client(endpoints=None) -> OpenAI:
+    """
+    Defines the LLM client, a router with model affinity if several endpoints are given.
+
+    """
+
+    return make_client(
+    endpoints=endpoints,
     base_url="path",
     api_key="key"
     )
+
+def get_LLM_answer(question: str, model: str, cache=None) -> str:
+    """
+    Given a question, get an answer from the specified LLM model.
+    Answers already in the response cache (ResponseCache) are not asked again.
+
+    """
     
-  
-    messages = [
-        {"role": "system", "content": f"Answer only in 'Yes', 'No', or 'NA'."},
-        {"role": "user", "content": question}
-    ]
+    # Define LLM client
+    client = get_LLM_client()
     
-    response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                
-    )
-    answer = response.choices[0].message.content # get answer
+    messages = get_LLM_messages(question)
+    
+    answer = get_cached_answer(client, model, messages, cache=cache) # get answer
     
     return answer
 
-def auto_LLMs(prompts_path: str, models: list, output_path: str):
+def auto_LLMs(prompts_path: str, models: list, output_path: str, concurrency=1, cache=None, resume=False, chunksize=1000,
+              stream=False, token_budget=None, time_budget=None, endpoints=None, retries=2, metrics=None):
     """
-    For a given list of LLMs and several prompts in a given folder, answers are generated, recorded, and written to a CSV file.
+    For a given list of LLMs and the prompt store in a given folder, answers are generated, recorded, and written to a CSV file.
+    Prompts are read lazily, `chunksize` at a time, and answers are keyed by their rule id.
+    Up to `concurrency` requests (an int, or a {model: int} mapping) are sent to each model in parallel.
+    With `cache` (True, a path, or a ResponseCache), answers from previous runs are reused instead of asked again.
+    Answers are journaled as they arrive; with `resume`, those of an interrupted run are kept.
+    With `stream`, answers are streamed, normalized to Yes/No/NA and cut off as soon as a verdict is parsed;
+    `token_budget` and `time_budget` bound each request, e.g. for reasoning models.
+    With several `endpoints`, requests are routed across those hosts, keeping each model on the hosts that have it loaded.
+    Failed requests are retried up to `retries` times. With `metrics` (True, a path, or a RequestMetrics), the timing,
+    token counts, retries, cache hits and error class of every prompt are written to llm_metrics.csv/.json.
  
     """
 
-    # Get rule prompts
+    # Get rule prompt store
     prompts_path = Path(prompts_path)
-    prompts = [prompt for prompt in os.listdir(prompts_path) if prompt.endswith(".txt")]
+    store_path = prompts_path / PROMPT_STORE_NAME
     
     output_path = Path(output_path) # get output folder as path
-    
-    questions = []
-    for prompt in prompts:
-        question = (prompts_path / prompt).read_text() # get each prompt text
-        questions.append(question)
-        
+    cache = open_cache(cache, output_path)
+    journal = ResultJournal(output_path / "output_journal.jsonl", resume=resume)
+    metrics = open_metrics(metrics, output_path)
 
-    results = {} 
+    client = get_LLM_client(endpoints)
+
+    results = {"rule_id": []} 
     for model in models:
         print(f"Prompting {model} for answers...")
         answers = []
+        rule_ids = []
         
-        for question in tqdm(questions):
-            answer = get_LLM_answer(question=question, model=model) # get answer from this model
+        for chunk in iter_prompt_store(store_path, chunksize=chunksize):
+            chunk_ids = [record["rule_id"] for record in chunk]
+            message_lists = [get_LLM_messages(record["prompt"]) for record in chunk]
+            chunk_answers = run_prompts(client, model, message_lists, concurrency=concurrency, cache=cache,
+                                        journal=journal, row_ids=chunk_ids, stream=stream,
+                                        token_budget=token_budget, time_budget=time_budget, retries=retries,
+                                        metrics=metrics) # get answers from this model
             
             if model == "deepseek-r1:70b":
-                
-                answer = re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip()
-                
-                answers.append(answer)          
-            else:
-                answers.append(answer)
+                chunk_answers = [re.sub(r"<think>.*?</think>", "", answer, flags=re.DOTALL).strip() for answer in chunk_answers]
+            
+            answers.extend(chunk_answers)
+            rule_ids.extend(chunk_ids)
             
+        results["rule_id"] = rule_ids
         results[model] = answers
     
     res_df = pd.DataFrame(results)
        
     res_df.to_csv(output_path / "output.csv",index=False)
+    journal.close()
+    
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+    if metrics is not None:
+        metrics.write()
     
 def serial_LLMs(template_path: str,
                 data_path: str,
@@ -177,7 +219,12 @@ def serial_LLMs(template_path: str,
                 procedure_descriptions_path: str,
                 prompts_path: str,
                 models: list,
-                output_path: str):
+                output_path: str,
+                rules_dir: str,
+                concurrency=1,
+                cache=None,
+                resume=False,
+                chunksize=1000):
     """
     Given a prompt template, horn rule table, and list of LLMs; format prompts, generate answers, and output as a table.
 
@@ -189,27 +236,33 @@ def serial_LLMs(template_path: str,
                      
                    diagnosis_descriptions_path=diagnosis_descriptions_path,
                     procedure_descriptions_path = procedure_descriptions_path,
-                    output_path=prompts_path)
+                    output_path=prompts_path,
+                    rules_dir=rules_dir)
     
     print("Getting answers...")
-    auto_LLMs(prompts_path=prompts_path, models=models, output_path=output_path)
+    auto_LLMs(prompts_path=prompts_path, models=models, output_path=output_path, concurrency=concurrency, cache=cache, resume=resume, chunksize=chunksize)
     
     print("Done.")
     
 
-template_path = "/app/prompt.txt"
-data_path = "/app/horn_rules.csv"
-diagnosis_descriptions_path = "/app/D_ICD_DIAGNOSES.csv"
-procedure_descriptions_path = "/app/D_CPT.csv"
-prompts_path = "/app/prompts"
+# Example (not run when imported)
+if __name__ == "__main__":
+    template_path = "/app/prompt.txt"
+    data_path = "/app/horn_rules.csv"
+    diagnosis_descriptions_path = "/app/D_ICD_DIAGNOSES.csv"
+    procedure_descriptions_path = "/app/D_CPT.csv"
+    prompts_path = "/app/prompts"
+    rules_dir = "/app/Rule filtering & LLM prep"  # folder of horn_rules.py
 
-models = [ "llama3.2:latest","llama3.1:70b","deepseek-r1:70b","mistral"]
-output_path = "/app/answers"
+    models = [ "llama3.2:latest","llama3.1:70b","deepseek-r1:70b","mistral"]
+    output_path = "/app/answers"
 
-serial_LLMs(template_path=template_path,
-            data_path=data_path,
-            diagnosis_descriptions_path=diagnosis_descriptions_path,
-            procedure_descriptions_path=procedure_descriptions_path,
-            prompts_path=prompts_path,
-            models=models,
-            output_path=output_path)
\ No newline at end of file
+    serial_LLMs(template_path=template_path,
+                data_path=data_path,
+                diagnosis_descriptions_path=diagnosis_descriptions_path,
+                procedure_descriptions_path=procedure_descriptions_path,
+                prompts_path=prompts_path,
+                models=models,
+                output_path=output_path,
+                rules_dir=rules_dir,
+                cache=True)
@@ -0,0 +1,148 @@
+#group patient ages with exact 1-D k-means on a weighted histogram of the distinct ages
+import numpy as np
+import pandas as pd
+
+
+# Step 1: collapse the ages into distinct values and their counts
+def age_histogram(ages):
+    """
+    Returns the sorted distinct ages and how many patients have each of them.
+    """
+    ages = pd.Series(ages).dropna().to_numpy(dtype=float)
+    return np.unique(ages, return_counts=True)
+
+
+def segment_costs(values, weights):
+    """
+    Returns the matrix of within-cluster sums of squares of every run values[i..j] (i <= j), inf elsewhere.
+    """
+    # Center the values so the prefix sums of squares do not lose precision
+    centered = values - np.average(values, weights=weights)
+    w = np.concatenate(([0.0], np.cumsum(weights)))
+    s = np.concatenate(([0.0], np.cumsum(weights * centered)))
+    q = np.concatenate(([0.0], np.cumsum(weights * centered ** 2)))
+
+    start, end = np.triu_indices(len(values))
+    costs = np.full((len(values), len(values)), np.inf)
+    total = w[end + 1] - w[start]
+    costs[start, end] = np.maximum(q[end + 1] - q[start] - (s[end + 1] - s[start]) ** 2 / total, 0.0)
+    return costs
+
+
+# Step 2: optimal clusterings for all k by dynamic programming over the sorted distinct values
+def optimal_kmeans_1d(values, weights, max_k):
+    """
+    Finds the exact k-means clustering of weighted 1-D values for k = 1..max_k.
+
+    In one dimension, optimal clusters are runs of consecutive sorted values, so the best split into k clusters is
+    found exactly by dynamic programming over the distinct values, instead of by KMeans restarts.
+
+    Args:
+        values (array): Sorted distinct values.
+        weights (array): Count of each value.
+        max_k (int): Largest number of clusters, capped at the number of distinct values.
+
+    Returns:
+        A dict {k: (WCSS, labels)}, labels giving the cluster (0..k-1, in increasing order of values) of each value.
+    """
+    n = len(values)
+    max_k = min(max_k, n)
+    costs = segment_costs(values, weights)
+
+    # best[k - 1][j]: lowest WCSS of values[0..j] in k clusters, split[k - 1][j]: start of its last cluster
+    best = [costs[0]]
+    split = [np.zeros(n, dtype=int)]
+    for k in range(2, max_k + 1):
+        # The last cluster is values[i..j], the first k - 1 clusters cover values[0..i - 1]
+        previous = np.concatenate(([np.inf], best[-1][:-1]))
+        candidates = previous[:, None] + costs
+        split.append(np.argmin(candidates, axis=0))
+        best.append(candidates[split[-1], np.arange(n)])
+
+    results = {}
+    for k in range(1, max_k + 1):
+        labels = np.empty(n, dtype=int)
+        end = n
+        for cluster in range(k - 1, -1, -1):
+            start = split[cluster][end - 1]
+            labels[start:end] = cluster
+            end = start
+        results[k] = (float(best[k - 1][n - 1]), labels)
+    return results
+
+
+def weighted_silhouette(values, weights, labels):
+    """
+    Computes the mean silhouette coefficient of all points from their histogram, equal to silhouette_score on the
+    expanded data (a point's own copies count as same-cluster points at distance 0).
+
+    Returns:
+        The silhouette score, NaN if there are fewer than 2 clusters (float).
+    """
+    k = labels.max() + 1
+    if k < 2:
+        return np.nan
+    one_hot = np.zeros((len(values), k))
+    one_hot[np.arange(len(values)), labels] = weights
+    sizes = one_hot.sum(axis=0)
+
+    # Total distance from each distinct value to the points of every cluster
+    distances = np.abs(values[:, None] - values[None, :]) @ one_hot
+    own_size = sizes[labels]
+    own = distances[np.arange(len(values)), labels]
+    a = np.divide(own, own_size - 1, out=np.zeros(len(values)), where=own_size > 1)
+    mean_distances = distances / sizes
+    mean_distances[np.arange(len(values)), labels] = np.inf
+    b = mean_distances.min(axis=1)
+
+    scale = np.maximum(a, b)
+    scores = np.divide(b - a, scale, out=np.zeros(len(values)), where=scale > 0)
+    scores[own_size <= 1] = 0.0  # singleton clusters score 0, as in scikit-learn
+    return float(np.average(scores, weights=weights))
+
+
+# Step 3: curves and bin edges for every k, and the AgeGroup labels of a chosen grouping
+def age_grouping_curves(ages, max_k=10):
+    """
+    Computes the elbow (WCSS) and silhouette curves of the optimal age groupings for k = 1..max_k.
+
+    Args:
+        ages (sequence): Patient ages, NaN values are ignored.
+        max_k (int): Largest number of groups.
+
+    Returns:
+        A DataFrame indexed by k with WCSS, Silhouette, Centers and Upper Bounds (the largest age of each group) columns.
+    """
+    values, weights = age_histogram(ages)
+    rows = []
+    for k, (wcss, labels) in optimal_kmeans_1d(values, weights, max_k).items():
+        rows.append({
+            'k': k,
+            'WCSS': wcss,
+            'Silhouette': weighted_silhouette(values, weights, labels),
+            'Centers': [float(np.average(values[labels == c], weights=weights[labels == c])) for c in range(k)],
+            'Upper Bounds': [float(values[labels == c].max()) for c in range(k)],
+        })
+    return pd.DataFrame(rows).set_index('k')
+
+
+def assign_age_groups(ages, upper_bounds, labels=None):
+    """
+    Labels each age with its group: the first group whose upper bound is at least the age.
+
+    Args:
+        ages (sequence): Patient ages.
+        upper_bounds (sequence): Increasing inclusive upper bound of each group.
+        labels (sequence): Group names, "group1", "group2", ... by default.
+
+    Returns:
+        A Series of group labels, NaN for missing ages and ages above the last bound.
+    """
+    if labels is None:
+        labels = [f"group{i + 1}" for i in range(len(upper_bounds))]
+    ages = pd.Series(ages)
+    groups = np.searchsorted(np.asarray(upper_bounds, dtype=float), ages.to_numpy(dtype=float), side='left')
+    valid = ages.notna().to_numpy() & (groups < len(upper_bounds))
+    result = pd.Series(np.nan, index=ages.index, dtype=object)
+    result[valid] = np.asarray(labels, dtype=object)[groups[valid]]
+    return result
@@ -0,0 +1,71 @@
+#sweep head coverage thresholds in one vectorized pass to get recall, precision and F-score curves
+import numpy as np
+import pandas as pd
+
+
+def rule_keys(df, match_cols):
+    """
+    Hashes the columns identifying a rule into one 64-bit key per row.
+    """
+    return pd.util.hash_pandas_object(df[match_cols].astype(str), index=False).to_numpy()
+
+
+def count_above(sorted_values, thresholds):
+    """
+    Counts, for every threshold, the values strictly greater than it.
+    """
+    return len(sorted_values) - np.searchsorted(sorted_values, thresholds, side='right')
+
+
+def sweep_thresholds(df_all, df_desired, hc_col, match_cols=('3',), thresholds=None, quantiles=None):
+    """
+    Computes recall, precision and F1 of keeping the rules whose head coverage is above each threshold.
+
+    A desired rule is retrieved at a threshold when it matches a rule of `df_all` on `match_cols` and both have a
+    head coverage above the threshold, as with filtering both tables and merging them. The tables are joined once
+    on a hashed rule key and sorted once, then every threshold is answered by a binary search.
+
+    Args:
+        df_all (DataFrame): All mined rules.
+        df_desired (DataFrame): The relevant (valid) rules.
+        hc_col (str): Head coverage column, present in both tables.
+        match_cols (sequence): Column(s) used to identify rule matches.
+        thresholds (sequence): Thresholds to evaluate. By default, the `quantiles` of df_all's head coverage,
+            or every distinct head coverage value if no quantiles are given either.
+        quantiles (sequence): Quantiles of df_all's head coverage to use as thresholds.
+
+    Returns:
+        A DataFrame with Threshold, Matching, Selected, Recall, Precision and F1 columns, one row per threshold.
+    """
+    match_cols = list(match_cols)
+    all_hc = df_all[hc_col].to_numpy(dtype=float)
+
+    if thresholds is None:
+        if quantiles is not None:
+            thresholds = df_all[hc_col].quantile(list(quantiles)).to_numpy()
+        else:
+            thresholds = np.unique(all_hc[~np.isnan(all_hc)])
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    # Pair matching rules once; a pair survives a threshold while both head coverages are above it
+    pairs = pd.DataFrame({'key': rule_keys(df_all, match_cols), 'hc': all_hc}).merge(
+        pd.DataFrame({'key': rule_keys(df_desired, match_cols), 'hc': df_desired[hc_col].to_numpy(dtype=float)}),
+        on='key', suffixes=('_all', '_desired'))
+    pair_hc = np.minimum(pairs['hc_all'].to_numpy(), pairs['hc_desired'].to_numpy())
+
+    # NaN never passes a threshold, drop it before sorting
+    matching = count_above(np.sort(pair_hc[~np.isnan(pair_hc)]), thresholds)
+    selected = count_above(np.sort(all_hc[~np.isnan(all_hc)]), thresholds)
+
+    recall = matching / len(df_desired) if len(df_desired) else np.zeros(len(thresholds))
+    precision = np.divide(matching, selected, out=np.zeros(len(thresholds)), where=selected > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(thresholds)), where=(precision + recall) > 0)
+
+    return pd.DataFrame({
+        'Threshold': thresholds,
+        'Matching': matching,
+        'Selected': selected,
+        'Recall': recall,
+        'Precision': precision,
+        'F1': f1,
+    })
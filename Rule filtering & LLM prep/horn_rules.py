@@ -0,0 +1,205 @@
+#parse Horn rules once into a columnar table of atoms with interned terms, and compact IRIs to CURIEs with a prefix trie
+import re
+import numpy as np
+import pandas as pd
+
+ATOM_PATTERN = re.compile(r'(https?://[\w\./#-]+)\(([^,]+),([^)]+)\)')
+
+# CURIE prefixes of the vocabularies used in the rules
+PREFIXES = {
+    'SPHN': 'https://biomedit.ch/rdf/sphn-ontology/sphn#',
+    'aidava-resource': 'https://biomedit.ch/rdf/sphn-ontology/AIDAVA/',
+    'ICD9': 'https://biomedit.ch/rdf/sphn-resource/icd-9-gm/2023/3/',
+    'CPT': 'https://www.aapc.com/codes/cpt-codes/',
+}
+
+
+# Step 1: map IRIs to and from CURIEs
+class PrefixTrie:
+    """
+    Character trie over namespace IRIs, finding the longest namespace an IRI starts with in one walk over the IRI
+    instead of trying every prefix in turn.
+    """
+
+    def __init__(self, prefixes=PREFIXES):
+        self.root = {}
+        self.namespaces = {}  # prefix -> namespace
+        for prefix, namespace in prefixes.items():
+            self.add(prefix, namespace)
+
+    def add(self, prefix, namespace):
+        node = self.root
+        for char in namespace:
+            node = node.setdefault(char, {})
+        node[None] = prefix  # the None key marks the end of a namespace
+        self.namespaces[prefix] = namespace
+
+    def split(self, iri):
+        """
+        Returns the (prefix, local name) of an IRI for its longest matching namespace, or (None, iri).
+        """
+        node, match = self.root, None
+        for position, char in enumerate(iri):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                match = (node[None], position + 1)
+        if match is None:
+            return None, iri
+        return match[0], iri[match[1]:]
+
+    def compact(self, iri):
+        """
+        Returns the CURIE of an IRI, e.g. "ICD9:4019", or the IRI itself if no namespace matches.
+        """
+        prefix, local = self.split(iri)
+        return iri if prefix is None else f"{prefix}:{local}"
+
+    def expand(self, curie):
+        """
+        Returns the IRI of a CURIE, or the CURIE itself if its prefix is unknown.
+        """
+        prefix, colon, local = curie.partition(':')
+        namespace = self.namespaces.get(prefix)
+        return curie if namespace is None or not colon else namespace + local
+
+
+# Step 2: parse rules into interned atoms
+class RuleTable:
+    """
+    Horn rules "head(a,b) <= body1(c,d) body2(e,f) ..." parsed once into one row per atom.
+
+    `atoms` has rule, position (0 for the head, 1.. for the body atoms in order), predicate, subject and object
+    columns, the last three holding ids into `terms`. Terms are kept as written in the rules: bare IRIs for
+    predicates and constants, and variable names such as X.
+    """
+
+    def __init__(self, terms, atoms, rule_count):
+        self.terms = terms  # id -> term
+        self.term_ids = {term: ix for ix, term in enumerate(terms)}
+        self.atoms = atoms
+        self.rule_count = rule_count
+
+    @classmethod
+    def from_strings(cls, rules):
+        """
+        Parses an iterable of rule strings in one streaming pass. Rules that cannot be parsed get no atoms.
+        """
+        terms, ids = [], {}
+        columns = {'rule': [], 'position': [], 'predicate': [], 'subject': [], 'object': []}
+
+        def intern(term):
+            ix = ids.get(term)
+            if ix is None:
+                ix = ids[term] = len(terms)
+                terms.append(term)
+            return ix
+
+        rule_count = 0
+        for rule_ix, rule in enumerate(rules):
+            rule_count = rule_ix + 1
+            rule = str(rule)
+            if '<=' not in rule:
+                continue
+            head_part, body_part = rule.split('<=', 1)
+            head_matches = ATOM_PATTERN.findall(head_part)
+            if not head_matches:
+                continue
+            # The head is the last atom before "<=", as in the original per-query parsing
+            for position, match in enumerate([head_matches[-1]] + ATOM_PATTERN.findall(body_part)):
+                predicate, subject, obj = (intern(x.strip()) for x in match)
+                columns['rule'].append(rule_ix)
+                columns['position'].append(position)
+                columns['predicate'].append(predicate)
+                columns['subject'].append(subject)
+                columns['object'].append(obj)
+
+        atoms = pd.DataFrame({name: np.asarray(values, dtype=np.int64) for name, values in columns.items()})
+        return cls(terms, atoms, rule_count)
+
+    def term_id(self, term):
+        """
+        Returns the id of a term, or -1 if no rule uses it.
+        """
+        return self.term_ids.get(term, -1)
+
+    def heads(self):
+        """
+        Returns the head atoms, indexed by rule.
+        """
+        return self.atoms[self.atoms['position'] == 0].set_index('rule')
+
+    def bodies(self):
+        """
+        Returns the body atoms, with their rule as a column.
+        """
+        return self.atoms[self.atoms['position'] > 0]
+
+    def split_terms(self, trie):
+        """
+        Splits every term once with the trie.
+
+        Returns:
+            The prefix (None if no namespace matches) and local name of each term id, as object arrays.
+        """
+        prefixes, locals_ = zip(*(trie.split(term) for term in self.terms)) if self.terms else ((), ())
+        return np.array(prefixes, dtype=object), np.array(locals_, dtype=object)
+
+    def compact_terms(self, trie):
+        """
+        Returns the CURIE of each term id (terms outside the trie's namespaces unchanged), as an object array.
+        """
+        prefixes, locals_ = self.split_terms(trie)
+        known = np.not_equal(prefixes, None)
+        compact = np.array(self.terms, dtype=object)
+        compact[known] = prefixes[known] + ':' + locals_[known]
+        return compact
+
+    def render(self, trie=None):
+        """
+        Writes the rules back as head and body strings, "pred(s,o)" per atom with body atoms separated by spaces,
+        with IRIs compacted to CURIEs if a trie is given.
+
+        Returns:
+            The head and body Series, indexed by rule, for the rules that could be parsed.
+        """
+        names = self.compact_terms(trie) if trie is not None else np.array(self.terms, dtype=object)
+        atoms = self.atoms
+        text = pd.Series(names[atoms['predicate'].to_numpy()] + '(' + names[atoms['subject'].to_numpy()] + ','
+                         + names[atoms['object'].to_numpy()] + ')', index=atoms.index, dtype=object)
+        head = atoms['position'] == 0
+        heads = pd.Series(text[head].to_numpy(), index=atoms.loc[head, 'rule'].to_numpy(), dtype=object)
+        bodies = text[~head].groupby(atoms.loc[~head, 'rule']).agg(' '.join).reindex(heads.index, fill_value='')
+        return heads, bodies
+
+    def rule_atoms(self, terms=None):
+        """
+        Yields each rule's (head, body) as (predicate, subject, object) tuples of terms, in rule order.
+        Rules that could not be parsed yield (None, []).
+
+        Args:
+            terms (sequence): Replacement form of each term id, e.g. the N-Triples form. `self.terms` by default.
+        """
+        terms = self.terms if terms is None else terms
+        atoms = self.atoms[['rule', 'predicate', 'subject', 'object']].to_numpy()
+        start = 0
+        for rule_ix in range(self.rule_count):
+            end = start
+            while end < len(atoms) and atoms[end, 0] == rule_ix:
+                end += 1
+            if end == start:
+                yield None, []
+                continue
+            triples = [(terms[p], terms[s], terms[o]) for _, p, s, o in atoms[start:end]]
+            yield triples[0], triples[1:]
+            start = end
+
+
+def read_rules(path):
+    """
+    Parses a file with one "head <= body" rule per line into a RuleTable, streaming it line by line.
+    Blank lines are skipped, so rule ids are the row numbers pandas' read_csv would give.
+    """
+    with open(path, encoding='utf-8') as f:
+        return RuleTable.from_strings(line.rstrip('\n') for line in f if line.strip())
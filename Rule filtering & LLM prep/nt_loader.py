@@ -0,0 +1,184 @@
+#stream an N-Triples file into an integer-encoded triple index, cached as memory-mapped arrays next to the source
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+from rule_metrics import TripleIndex
+
+CACHE_VERSION = 1
+
+
+# Step 1: stream triples from the N-Triples file
+def parse_nt_line(line):
+    """
+    Splits an N-Triples line into its subject, predicate and object terms, or returns None for blank and comment lines.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    subject, predicate, rest = line.split(None, 2)
+    obj = rest.rstrip()
+    if obj.endswith('.'):
+        obj = obj[:-1].rstrip()
+    return subject, predicate, obj
+
+
+def iter_nt_chunks(nt_file, chunksize=1_000_000):
+    """
+    Yields lists of at most `chunksize` (subject, predicate, object) terms from an N-Triples file.
+    """
+    chunk = []
+    with open(nt_file, encoding='utf-8') as f:
+        for line in f:
+            triple = parse_nt_line(line)
+            if triple is None:
+                continue
+            chunk.append(triple)
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+# Step 2: build the term dictionary and the triple arrays chunk by chunk
+def file_hash(path, blocksize=1 << 24):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_cache(nt_file, cache_dir, chunksize=1_000_000):
+    """
+    Encodes an N-Triples file into the binary cache: terms.txt (one term per line, line number = id),
+    subjects.npy / objects.npy (ids sorted by predicate, subject, object, without duplicates),
+    predicates.npy (predicate id, start and end offset of its partition) and meta.json.
+    """
+    nt_file = Path(nt_file)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / 'meta.json').unlink(missing_ok=True)  # the cache only counts as built once meta.json is written
+
+    terms = {}
+    raw_path = cache_dir / 'triples.raw'
+    with open(cache_dir / 'terms.txt', 'w', encoding='utf-8') as terms_out, open(raw_path, 'wb') as raw_out:
+        for chunk in iter_nt_chunks(nt_file, chunksize):
+            ids = np.empty((len(chunk), 3), dtype=np.int64)
+            for row, triple in enumerate(chunk):
+                for col, term in enumerate(triple):
+                    term_id = terms.get(term)
+                    if term_id is None:
+                        term_id = terms[term] = len(terms)
+                        terms_out.write(term + '\n')
+                    ids[row, col] = term_id
+            ids.tofile(raw_out)
+    del terms
+
+    # Sort by predicate, subject, object and drop duplicate facts
+    triples = np.fromfile(raw_path, dtype=np.int64).reshape(-1, 3)
+    order = np.lexsort((triples[:, 2], triples[:, 0], triples[:, 1]))
+    triples = triples[order]
+    if len(triples):
+        keep = np.ones(len(triples), dtype=bool)
+        keep[1:] = np.any(triples[1:] != triples[:-1], axis=1)
+        triples = triples[keep]
+
+    predicates, starts = np.unique(triples[:, 1], return_index=True)
+    ends = np.append(starts[1:], len(triples))
+    np.save(cache_dir / 'subjects.npy', np.ascontiguousarray(triples[:, 0]))
+    np.save(cache_dir / 'objects.npy', np.ascontiguousarray(triples[:, 2]))
+    np.save(cache_dir / 'predicates.npy', np.stack([predicates, starts, ends], axis=1))
+    raw_path.unlink()
+
+    stat = nt_file.stat()
+    meta = {'version': CACHE_VERSION, 'sha256': file_hash(nt_file), 'size': stat.st_size, 'mtime': stat.st_mtime}
+    (cache_dir / 'meta.json').write_text(json.dumps(meta))
+
+
+# Step 3: open the cache, rebuilding it when the source file changed
+def cache_is_fresh(nt_file, cache_dir):
+    meta_path = Path(cache_dir) / 'meta.json'
+    if not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text())
+    if meta.get('version') != CACHE_VERSION:
+        return False
+    stat = Path(nt_file).stat()
+    if meta['size'] == stat.st_size and meta['mtime'] == stat.st_mtime:
+        return True
+    # Touched or copied, only rebuild if the content changed
+    if meta['size'] == stat.st_size and meta['sha256'] == file_hash(nt_file):
+        meta['mtime'] = stat.st_mtime
+        meta_path.write_text(json.dumps(meta))
+        return True
+    return False
+
+
+def open_partitions(cache_dir):
+    """
+    Returns the predicate partitions of a binary cache as memory-mapped subject and object id arrays,
+    whose pages are shared across processes.
+    """
+    cache_dir = Path(cache_dir)
+    subjects = np.load(cache_dir / 'subjects.npy', mmap_mode='r')
+    objects = np.load(cache_dir / 'objects.npy', mmap_mode='r')
+    predicates = np.load(cache_dir / 'predicates.npy', mmap_mode='r')
+    return {
+        int(p_id): (subjects[start:end], objects[start:end])
+        for p_id, start, end in predicates
+    }
+
+
+def lookup_terms(cache_dir, terms):
+    """
+    Returns {term: id} for the given terms that occur in a binary cache, streaming terms.txt once
+    instead of loading the whole term dictionary.
+    """
+    wanted = set(terms)
+    found = {}
+    with open(Path(cache_dir) / 'terms.txt', encoding='utf-8') as f:
+        for term_id, line in enumerate(f):
+            term = line.rstrip('\n')
+            if term in wanted:
+                found[term] = term_id
+                if len(found) == len(wanted):
+                    break
+    return found
+
+
+def open_triple_cache(cache_dir, terms=True):
+    """
+    Opens a binary cache as a TripleIndex whose arrays are memory-mapped, so pages are shared across processes.
+
+    With terms=False the term dictionary is not loaded, and the index can only be queried with term ids
+    (see rule_metrics.encode_atoms).
+    """
+    cache_dir = Path(cache_dir)
+    term_ids = {}
+    if terms:
+        with open(cache_dir / 'terms.txt', encoding='utf-8') as f:
+            term_ids = {line.rstrip('\n'): term_id for term_id, line in enumerate(f)}
+    return TripleIndex(term_ids, open_partitions(cache_dir))
+
+
+def ensure_triple_cache(nt_file, cache_dir=None, chunksize=1_000_000):
+    """
+    Builds the binary cache of an N-Triples file ("<file>.cache" by default) unless it is up to date,
+    and returns its directory.
+    """
+    nt_file = Path(nt_file)
+    cache_dir = Path(cache_dir) if cache_dir is not None else nt_file.with_name(nt_file.name + '.cache')
+    if not cache_is_fresh(nt_file, cache_dir):
+        print(f"Building triple cache {cache_dir} ...")
+        build_cache(nt_file, cache_dir, chunksize)
+    return cache_dir
+
+
+def load_nt_index(nt_file, cache_dir=None, chunksize=1_000_000):
+    """
+    Loads an N-Triples file as a TripleIndex, through a memory-mapped binary cache next to the source file
+    ("<file>.cache" by default) that is rebuilt whenever the source file's content changes.
+    """
+    return open_triple_cache(ensure_triple_cache(nt_file, cache_dir, chunksize))
@@ -0,0 +1,75 @@
+#score rules across a process pool, all workers sharing one memory-mapped copy of the encoded graph
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from rule_metrics import encode_atoms, is_variable, parse_rules, score_atoms
+from nt_loader import ensure_triple_cache, lookup_terms, open_triple_cache
+
+_index = None  # the worker's view of the graph
+
+
+def _init_worker(cache_dir):
+    global _index
+    # Only the memory-mapped id arrays, whose pages are shared with the other workers: rules arrive encoded as ids,
+    # so workers never load the term dictionary
+    _index = open_triple_cache(cache_dir, terms=False)
+
+
+def _score_chunk(positions, rule_atoms):
+    return positions, score_atoms(rule_atoms, _index)
+
+
+def score_rules_parallel(rules, cache_dir, processes=None, chunksize=2000):
+    """
+    Scores rules like `score_rules`, split across a process pool.
+
+    Rules are parsed and their constants resolved to term ids once in the parent, which only looks up the terms the
+    rules use. They are grouped by head before being chunked, so workers can share atom bindings and head sizes
+    within a chunk, and the scores are put back in the order of `rules`.
+
+    Args:
+        rules (sequence): Rule strings.
+        cache_dir (str or Path): Binary triple cache built by nt_loader.
+        processes (int): Number of worker processes, all cores by default.
+        chunksize (int): Number of rules per task.
+
+    Returns:
+        A DataFrame with Support, Confidence, PCA Confidence and Head Coverage columns, aligned with `rules`.
+    """
+    rules = [str(rule) for rule in rules]
+    rule_atoms = list(parse_rules(rules))
+    constants = {term for head, body in rule_atoms for atom in ([head] if head else []) + body
+                 for term in atom if not is_variable(term)}
+    rule_atoms = encode_atoms(rule_atoms, lookup_terms(cache_dir, constants))
+
+    heads = [rule.split('<=', 1)[0] for rule in rules]
+    order = np.argsort(np.asarray(heads, dtype=object), kind='stable')
+    chunks = [order[start:start + chunksize] for start in range(0, len(order), chunksize)]
+
+    scores = [None] * len(rules)
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=_init_worker, initargs=(str(cache_dir),)) as executor:
+        futures = [executor.submit(_score_chunk, chunk, [rule_atoms[i] for i in chunk]) for chunk in chunks]
+        for future in futures:
+            positions, chunk_scores = future.result()
+            for position, row in zip(positions, chunk_scores.itertuples(index=False)):
+                scores[position] = tuple(row)
+
+    return pd.DataFrame(scores, columns=['Support', 'Confidence', 'PCA Confidence', 'Head Coverage'])
+
+
+def calculate_metrics_parallel(rules_csv, nt_file, output_csv, rule_col=3, processes=None, chunksize=2000):
+    """
+    Same as rule_metrics.calculate_metrics, reading the facts from an N-Triples file through its binary cache
+    and scoring the rules across a process pool.
+    """
+    cache_dir = ensure_triple_cache(nt_file)  # build or refresh the cache once, before the workers attach to it
+
+    rules_df = pd.read_csv(rules_csv, sep="\t", header=None)
+
+    scores = score_rules_parallel(rules_df[rule_col], cache_dir, processes=processes, chunksize=chunksize)
+    for column in scores.columns:
+        rules_df[column] = scores[column].to_numpy()
+
+    rules_df.to_csv(output_csv, sep="\t", index=False)
+    return rules_df
@@ -0,0 +1,283 @@
+#calculate discovered rules' support, confidence, PCA confidence and head coverage scores
+#on an integer-encoded, predicate-partitioned triple index instead of per-rule SPARQL queries
+import re
+import numpy as np
+import pandas as pd
+from horn_rules import RuleTable
+
+
+# Step 1: dictionary-encode the facts and partition them by predicate
+class TripleIndex:
+    """
+    Triples with every term encoded as an integer id, stored as NumPy subject/object arrays per predicate.
+
+    Terms are keyed by their N-Triples form, e.g. "<http://...>" for IRIs, so a rule constant
+    only matches IRIs, as in SPARQL.
+    """
+
+    def __init__(self, terms, partitions):
+        self.terms = terms  # term -> id
+        self.partitions = partitions  # predicate id -> (subject ids, object ids)
+
+    @classmethod
+    def from_triples(cls, triples):
+        """
+        Builds the index from an iterable of (subject, predicate, object) terms in N-Triples form.
+        """
+        terms = {}
+        columns = {}
+        for s, p, o in triples:
+            s_id = terms.setdefault(s, len(terms))
+            p_id = terms.setdefault(p, len(terms))
+            o_id = terms.setdefault(o, len(terms))
+            subjects, objects = columns.setdefault(p_id, ([], []))
+            subjects.append(s_id)
+            objects.append(o_id)
+
+        partitions = {
+            p_id: _unique_pairs(np.asarray(subjects, dtype=np.int64), np.asarray(objects, dtype=np.int64))
+            for p_id, (subjects, objects) in columns.items()
+        }
+        return cls(terms, partitions)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Builds the index from an rdflib graph.
+        """
+        return cls.from_triples((s.n3(), p.n3(), o.n3()) for s, p, o in graph)
+
+    def term_id(self, term):
+        """
+        Returns the id of a term in N-Triples form, or -1 if it does not occur in the facts.
+        Terms that are already encoded as ids are returned as they are.
+        """
+        if isinstance(term, (int, np.integer)):
+            return term
+        return self.terms.get(term, -1)
+
+    def predicate(self, predicate):
+        """
+        Returns the subject and object id arrays of a predicate given in N-Triples form.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        return self.partitions.get(self.term_id(predicate), (empty, empty))
+
+
+def _unique_pairs(subjects, objects):
+    # Facts are a set: drop duplicate triples, sorted by subject then object
+    pairs = np.unique(np.stack([subjects, objects], axis=1), axis=0) if len(subjects) else np.empty((0, 2), dtype=np.int64)
+    return np.ascontiguousarray(pairs[:, 0]), np.ascontiguousarray(pairs[:, 1])
+
+
+# Step 2: parse rules into atoms
+def is_variable(term):
+    # Constants are in N-Triples form (IRIs, blank nodes or literals) or already encoded as ids, anything else is a variable
+    return isinstance(term, str) and not term.startswith(('<', '_:', '"'))
+
+
+def to_term(arg):
+    # IRIs in rules are written bare, e.g. http://...#Male
+    return f"<{arg}>" if re.match(r'https?://', arg) else arg
+
+
+def parse_rule(rule):
+    """
+    Splits a rule "head(a,b) <= body1(c,d) body2(e,f) ..." into its head atom and body atoms.
+
+    Each atom is a (predicate, subject, object) tuple in N-Triples form, variables are kept as written (e.g. X).
+    Returns (None, []) if the rule cannot be parsed.
+    """
+    return next(parse_rules([rule]))
+
+
+def parse_rules(rules):
+    """
+    Parses a sequence of rules once into a RuleTable and yields each rule's atoms as `parse_rule` returns them.
+    """
+    table = RuleTable.from_strings(rules)
+    # Convert each distinct term to N-Triples form once, not once per atom
+    return table.rule_atoms(terms=[to_term(term) for term in table.terms])
+
+
+# Step 3: match and join atoms on the integer arrays
+def match_atom(index, atom):
+    """
+    Returns the variable bindings of an atom as a DataFrame with one column per variable and one row per matching fact.
+    """
+    predicate, arg1, arg2 = atom
+    subjects, objects = index.predicate(predicate)
+    mask = np.ones(len(subjects), dtype=bool)
+    bindings = {}
+
+    for arg, values in ((arg1, subjects), (arg2, objects)):
+        if is_variable(arg):
+            if arg in bindings:  # same variable twice, e.g. r(X,X)
+                mask &= bindings[arg] == values
+            else:
+                bindings[arg] = values
+        else:
+            mask &= values == index.term_id(arg)
+
+    if not bindings:
+        return pd.DataFrame(index=range(int(mask.sum())))
+    return pd.DataFrame({var: values[mask] for var, values in bindings.items()})
+
+
+def atom_variables(atom):
+    variables = []
+    for arg in atom[1:]:
+        if is_variable(arg) and arg not in variables:
+            variables.append(arg)
+    return variables
+
+
+def project(bindings, variables):
+    """
+    Keeps the distinct rows of a binding table over the given variables.
+    """
+    variables = [var for var in variables if var in bindings.columns]
+    if not variables:
+        return pd.DataFrame(index=range(min(len(bindings), 1)))
+    return bindings[variables].drop_duplicates(ignore_index=True)
+
+
+def hash_join(left, right):
+    """
+    Natural join of two binding tables on their shared variables, a cross product if they share none.
+    """
+    shared = [var for var in left.columns if var in right.columns]
+    if shared:
+        return left.merge(right, on=shared, how="inner")
+    # a table without variables (an atom of constants) only keeps or empties the other side
+    if len(left.columns) == 0:
+        return right if len(left) else right.iloc[:0]
+    if len(right.columns) == 0:
+        return left if len(right) else left.iloc[:0]
+    return left.merge(right, how="cross")
+
+
+def plan_joins(atoms, bindings):
+    """
+    Orders atoms for joining: start with the smallest atom, then always join the smallest atom sharing a variable
+    with the atoms joined so far, falling back to the smallest remaining atom (a cross product) only if none does.
+    """
+    remaining = sorted(range(len(atoms)), key=lambda i: len(bindings[i]))
+    order = [remaining.pop(0)]
+    seen = set(atom_variables(atoms[order[0]]))
+    while remaining:
+        connected = [i for i in remaining if seen & set(atom_variables(atoms[i]))]
+        nxt = connected[0] if connected else remaining[0]
+        remaining.remove(nxt)
+        order.append(nxt)
+        seen |= set(atom_variables(atoms[nxt]))
+    return order
+
+
+def distinct_bindings(atoms, bindings, keep):
+    """
+    Joins atoms following `plan_joins` and returns the distinct bindings of the `keep` variables.
+
+    After each join, variables no later atom and no `keep` variable needs are projected away and duplicates dropped,
+    so intermediate tables stay small.
+    """
+    order = plan_joins(atoms, bindings)
+    result = project(bindings[order[0]], list(bindings[order[0]].columns))
+    for position, i in enumerate(order[1:], start=1):
+        result = hash_join(result, bindings[i])
+        needed = set(keep)
+        for j in order[position + 1:]:
+            needed |= set(atom_variables(atoms[j]))
+        result = project(result, [var for var in result.columns if var in needed])
+    return project(result, keep)
+
+
+def score_rule(index, head, body, cache=None):
+    """
+    Computes support, confidence, PCA confidence and head coverage of a rule with any number of body atoms.
+
+    Support counts the distinct head variable bindings for which body and head hold; confidence divides it by the
+    distinct head bindings of the body, PCA confidence by those whose head subject has some head fact,
+    and head coverage by the number of head facts with the head's subject.
+
+    Args:
+        index (TripleIndex): The encoded facts.
+        head (tuple): The head atom.
+        body (list): The body atoms.
+        cache (dict): Memo of atom bindings and head sizes shared across rules.
+
+    Returns:
+        (support, confidence, pca_confidence, head_coverage)
+    """
+    cache = {} if cache is None else cache
+
+    def bindings(atom):
+        if atom not in cache:
+            cache[atom] = match_atom(index, atom)
+        return cache[atom]
+
+    head_vars = atom_variables(head)
+    subject_vars = [head[1]] if is_variable(head[1]) else []
+    pca_head = (head[0], head[1], "?pca_w")
+    body_bindings = distinct_bindings(body, [bindings(atom) for atom in body], head_vars)
+    pca_bindings = bindings(pca_head)
+
+    support = len(project(hash_join(body_bindings, bindings(head)), head_vars))
+    total_b_matches = len(body_bindings)
+    total_b_pca_matches = len(project(hash_join(body_bindings, project(pca_bindings, subject_vars)), head_vars))
+    total_h_r_matches = len(pca_bindings)  # shared by all rules with the same head predicate and subject
+
+    confidence = support / total_b_matches if support > 0 else 0
+    pca_confidence = support / total_b_pca_matches if support > 0 else 0
+    head_coverage = support / total_h_r_matches if total_h_r_matches > 0 else 0
+    return support, confidence, pca_confidence, head_coverage
+
+
+def encode_atoms(rule_atoms, term_ids):
+    """
+    Replaces the constants and predicates of parsed rules by their ids in `term_ids` ({term: id}, -1 if missing),
+    so the rules can be scored against an index without its term dictionary.
+    """
+    def encode(atom):
+        return tuple(term if is_variable(term) else term_ids.get(term, -1) for term in atom)
+
+    return [(None, []) if head is None else (encode(head), [encode(atom) for atom in body]) for head, body in rule_atoms]
+
+
+def score_rules(rules, index):
+    """
+    Scores a sequence of rule strings in bulk, sharing atom bindings and head sizes across rules.
+
+    Returns:
+        A DataFrame with Support, Confidence, PCA Confidence and Head Coverage columns, aligned with `rules`.
+    """
+    return score_atoms(parse_rules(rules), index)
+
+
+def score_atoms(rule_atoms, index):
+    """
+    Same as `score_rules`, for rules already parsed into (head, body) atoms, e.g. by `parse_rules` or `encode_atoms`.
+    """
+    cache = {}
+    scores = []
+    for head, body in rule_atoms:
+        if head is None or not body:
+            scores.append((0, 0.0, 0.0, 0.0))
+            continue
+        scores.append(score_rule(index, head, body, cache))
+
+    return pd.DataFrame(scores, columns=['Support', 'Confidence', 'PCA Confidence', 'Head Coverage'])
+
+
+def calculate_metrics(rules_csv, index, output_csv, rule_col=3):
+    """
+    Reads a tab-separated rules file, scores its rules and writes them with their metric columns.
+    """
+    rules_df = pd.read_csv(rules_csv, sep="\t", header=None)
+
+    scores = score_rules(rules_df[rule_col], index)
+    for column in scores.columns:
+        rules_df[column] = scores[column].to_numpy()
+
+    rules_df.to_csv(output_csv, sep="\t", index=False)
+    return rules_df